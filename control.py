@@ -169,10 +169,11 @@ def list(db, name, running):
 @click.option('--system')
 @click.option('-f', is_flag=True, default=False)
 @click.option('-n', default=10)
-def tail(name, system, n, f):
+@click.option('--grep', help='only show lines matching this regexp')
+def tail(name, system, n, f, grep):
     """Connects to the loaders and tail -f tpch.log"""
     r = bench.Run(name, system)
-    r.tail(follow=f, n=n)
+    r.tail(follow=f, n=n, pattern=grep)
     return
 
 
@@ -8,6 +8,54 @@ delete
                  from job join run on run.id = job.run
                 where run.name = :'run');
 
+delete
+  from backlog
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from saturation
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from tpch_test
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from refresh
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from histogram
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from load_step
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from load_copy
+ where job in (select job.id
+                 from job join run on run.id = job.run
+                where run.name = :'run');
+
+delete
+  from sync
+ where run in (select run.id
+                 from run
+                where run.name = :'run');
+
 delete
   from job
  where run in (select run.id
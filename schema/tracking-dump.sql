@@ -0,0 +1,60 @@
+--
+-- Dump the tracking tables for an incremental merge: only the rows of the
+-- query, histogram and backlog tables past the given watermarks, and the
+-- other tables in full. See tracking-merge-data.sql.
+--
+-- The dump is a single stream on stdout, read over ssh by the controller
+-- and copied straight into its results database: each table is a line
+-- with its name, then its rows in COPY text format, then the end of data
+-- marker \. on a line of its own.
+--
+-- The share lock waits for the tracking writes in progress and blocks new
+-- ones until we're done, so that no row below the watermarks is missed.
+--
+\set QUIET on
+
+begin;
+
+lock table query, histogram, backlog in share mode;
+
+\qecho run
+copy run to stdout;
+\qecho '\\.'
+
+\qecho job
+copy job to stdout;
+\qecho '\\.'
+
+\qecho query
+copy (select * from query where id > :query_id) to stdout;
+\qecho '\\.'
+
+\qecho backlog
+copy (select * from backlog where id > :backlog_id) to stdout;
+\qecho '\\.'
+
+\qecho histogram
+copy (select * from histogram where id > :histogram_id) to stdout;
+\qecho '\\.'
+
+\qecho saturation
+copy saturation to stdout;
+\qecho '\\.'
+
+\qecho tpch_test
+copy tpch_test to stdout;
+\qecho '\\.'
+
+\qecho refresh
+copy refresh to stdout;
+\qecho '\\.'
+
+\qecho load_step
+copy load_step to stdout;
+\qecho '\\.'
+
+\qecho load_copy
+copy load_copy to stdout;
+\qecho '\\.'
+
+commit;
@@ -1,26 +1,132 @@
-begin;
+--
+-- Merging is incremental: the loader dumps the rows of the query,
+-- histogram and backlog tables past the watermarks of the previous merge,
+-- and the other tables in full. Merging the same dump again is a no-op.
+--
+-- Run in a single transaction, after filling in the merge schema, either
+-- by scripts/merge-results.sh or by the controller's streaming merge.
+--
 
+-- the run is merged once, later merges only update its duration
 insert into public.run(name, system, setup, schedule, start, duration, sf)
      select name, system, setup, schedule, start, duration, sf
        from merge.run
-  returning id as run_id
+on conflict (name, system)
+  do update set duration = excluded.duration;
 
-\gset
-\echo :run_id
+-- the id of the run in the results database
+create temp table merged_run on commit drop
+    as
+select r.id
+  from public.run r
+       join merge.run m using(name, system);
 
-insert into public.job(run, name, start, duration, steps)
-     select :run_id, name, start, duration, steps
-       from merge.job
-   order by job.id;
+-- jobs are known by their loader id, and their duration changes over time
+insert into public.job(run, name, start, duration, steps, source_id)
+     select merged_run.id, name, start, duration, steps, job.id
+       from merge.job, merged_run
+   order by job.id
+on conflict (run, source_id)
+  do update set duration = excluded.duration,
+                steps = excluded.steps;
 
-select max(id) - (select max(id) from merge.job) as job_id_diff
-  from job
+-- the loader's job ids and their id in the results database
+create temp table merged_job on commit drop
+    as
+select job.source_id, job.id
+  from public.job
+       join merged_run on merged_run.id = job.run;
 
-\gset
-\echo :job_id_diff
+create temp table watermark on commit drop
+    as
+select relname, watermark
+  from public.sync
+       join merged_run on merged_run.id = sync.run;
 
-insert into public.query(job, name, duration)
-     select job + :job_id_diff, name, duration
-       from merge.query;
+insert into public.query(job, name, duration, plan_time, exec_time)
+     select distinct on (q.id)
+            job.id, q.name, q.duration, q.plan_time, q.exec_time
+       from merge.query q
+            join merged_job job on job.source_id = q.job
+      where q.id > coalesce((select watermark
+                               from watermark
+                              where relname = 'query'), 0)
+   order by q.id;
 
-commit;
+insert into public.backlog(job, ts, depth)
+     select distinct on (b.id)
+            job.id, b.ts, b.depth
+       from merge.backlog b
+            join merged_job job on job.source_id = b.job
+      where b.id > coalesce((select watermark
+                               from watermark
+                              where relname = 'backlog'), 0)
+   order by b.id;
+
+insert into public.histogram(job, name, ts, count, total, min, max,
+                             buckets, counts)
+     select distinct on (h.id)
+            job.id, h.name, h.ts, h.count, h.total, h.min, h.max,
+            h.buckets, h.counts
+       from merge.histogram h
+            join merged_job job on job.source_id = h.job
+      where h.id > coalesce((select watermark
+                               from watermark
+                              where relname = 'histogram'), 0)
+   order by h.id;
+
+insert into public.sync(run, relname, watermark)
+     select merged_run.id, w.relname, w.watermark
+       from merged_run,
+            (select 'query', max(id) from merge.query
+              union all
+             select 'backlog', max(id) from merge.backlog
+              union all
+             select 'histogram', max(id) from merge.histogram)
+            as w(relname, watermark)
+      where w.watermark is not null
+on conflict (run, relname)
+  do update set watermark = greatest(sync.watermark, excluded.watermark);
+
+-- the other tables are small and their rows change, replace them
+delete from public.saturation
+      where job in (select id from merged_job);
+
+delete from public.tpch_test
+      where job in (select id from merged_job);
+
+delete from public.refresh
+      where job in (select id from merged_job);
+
+delete from public.load_step
+      where job in (select id from merged_job);
+
+delete from public.load_copy
+      where job in (select id from merged_job);
+
+insert into public.saturation(job, name, stage, cpu, qpm, p95, knee)
+     select job.id, s.name, s.stage, s.cpu, s.qpm, s.p95, s.knee
+       from merge.saturation s
+            join merged_job job on job.source_id = s.job;
+
+insert into public.tpch_test(job, test, sf, streams)
+     select job.id, t.test, t.sf, t.streams
+       from merge.tpch_test t
+            join merged_job job on job.source_id = t.job;
+
+insert into public.refresh(job, updset, start, rf1, rf2)
+     select job.id, r.updset, r.start, r.rf1, r.rf2
+       from merge.refresh r
+            join merged_job job on job.source_id = r.job;
+
+insert into public.load_step(job, step, attempts, start, duration, relname,
+                             concurrency)
+     select job.id, l.step, l.attempts, l.start, l.duration, l.relname,
+            l.concurrency
+       from merge.load_step l
+            join merged_job job on job.source_id = l.job;
+
+insert into public.load_copy(job, relname, step, rows, bytes, duration)
+     select job.id, c.relname, c.step, c.rows, c.bytes, c.duration
+       from merge.load_copy c
+            join merged_job job on job.source_id = c.job;
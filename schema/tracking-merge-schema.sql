@@ -1,9 +1,12 @@
-begin;
-
 create schema merge;
 
 create table merge.run(like public.run);
 create table merge.job(like public.job);
 create table merge.query(like public.query);
-
-commit;
+create table merge.backlog(like public.backlog);
+create table merge.saturation(like public.saturation);
+create table merge.tpch_test(like public.tpch_test);
+create table merge.refresh(like public.refresh);
+create table merge.histogram(like public.histogram);
+create table merge.load_step(like public.load_step);
+create table merge.load_copy(like public.load_copy);
@@ -36,6 +36,138 @@ create table if not exists query
    duration  interval
  );
 
+--
+-- open-loop streams sample how many queries are waiting for a connection
+--
+create table if not exists backlog
+ (
+   job       integer not null references job(id),
+   ts        timestamptz not null,
+   depth     integer not null
+ );
+
+--
+-- saturation jobs run a stream job per stage, with increasing concurrency
+--
+create table if not exists saturation
+ (
+   job       integer not null references job(id),
+   name      text not null,
+   stage     integer not null,
+   cpu       integer not null,
+   qpm       numeric,
+   p95       interval,
+   knee      boolean not null default false
+ );
+
+--
+-- TPC-H power and throughput tests, see the power, throughput and qphh views,
+-- those jobs are not reported in the results, qpm and query_timings views
+--
+create table if not exists tpch_test
+ (
+   job       integer not null references job(id),
+   test      text not null check(test in ('power', 'throughput')),
+   sf        integer not null,
+   streams   integer not null
+ );
+
+--
+-- refresh pairs: RF1 inserts new sales and RF2 deletes old sales, using
+-- the update set number updset, reserved before running the refresh pair
+--
+create table if not exists refresh
+ (
+   job       integer not null references job(id),
+   updset    integer not null,
+   start     timestamptz,
+   rf1       interval,
+   rf2       interval
+ );
+
+--
+-- stream jobs flush a snapshot of their latency histograms every 10s, one
+-- row per query name, with the counts of each bucket in the snapshot: the
+-- buckets are the lowest timing they count, in microseconds, see the
+-- histogram_timings view
+--
+create table if not exists histogram
+ (
+   job       integer not null references job(id),
+   name      text not null,
+   ts        timestamptz not null,
+   count     bigint not null,
+   total     interval not null,
+   min       interval not null,
+   max       interval not null,
+   buckets   bigint[] not null,
+   counts    bigint[] not null
+ );
+
+-- the start column is more recent than the table
+alter table refresh add column if not exists start timestamptz;
+
+-- the prepared stream mode tracks planning and execution times separately
+alter table query add column if not exists plan_time interval;
+alter table query add column if not exists exec_time interval;
+
+--
+-- results are merged incrementally from the loaders into a central results
+-- database: rows of the query, histogram and backlog tables past the sync
+-- watermark of the run are appended, and the job ids of the loader are
+-- kept in the source_id column to map them to the central job ids
+--
+alter table histogram add column if not exists id bigserial;
+alter table backlog add column if not exists id bigserial;
+alter table job add column if not exists source_id integer;
+
+create unique index if not exists job_run_source_id_key
+    on job(run, source_id);
+
+create table if not exists sync
+ (
+   run       integer not null references run(id),
+   relname   text not null,
+   watermark bigint not null,
+
+   primary key(run, relname)
+ );
+
+--
+-- load jobs record each step once it's committed, so that running the job
+-- again only loads the missing steps, see load.py
+--
+create table if not exists load_step
+ (
+   job       integer not null references job(id),
+   step      integer not null,
+   attempts  integer not null,
+   start     timestamptz not null,
+   duration  interval not null
+ );
+
+-- load jobs split in (table, step) units record the table, a null relname
+-- is a whole step of dbgen
+alter table load_step add column if not exists relname text;
+
+-- how many units were allowed to load at the same time when the unit
+-- started, see pressure.py for adaptive loads
+alter table load_step add column if not exists concurrency integer;
+
+--
+-- dbgen reports the rows and bytes it sent in each COPY stream, and how
+-- long the stream took, one row per table and step
+--
+create table if not exists load_copy
+ (
+   job       integer not null references job(id),
+   relname   text not null,
+   step      integer not null,
+   rows      bigint not null,
+   bytes     bigint not null,
+   duration  interval not null
+ );
+
 create or replace view results
     as
      select run.name as run,
@@ -55,6 +187,7 @@ create or replace view results
        from job
                  join run on run.id = job.run
             left join query on query.job = job.id
+      where not exists (select 1 from tpch_test where tpch_test.job = job.id)
    group by run.id, job.id
    order by run.id, job.start;
 
@@ -85,8 +218,8 @@ create or replace view qpm as
                  join run on run.id = job.run
             left join query on query.job = job.id
 
-      where job.steps is not null
-         or job.name ~ 'stream'
+      where (job.steps is not null or job.name ~ 'stream')
+        and not exists (select 1 from tpch_test where tpch_test.job = job.id)
 
      group by run.id, job.id, query.job
      order by run.id, job.start;
@@ -117,6 +250,9 @@ create or replace view query_timings as
                    limit 1
                 )
                 as sf on true
+          where not exists (select 1
+                              from tpch_test
+                             where tpch_test.job = job.id)
        group by run.id, sf.sf, job.id, query.name
     )
     select run, system, sf, jobname, query, count,
@@ -130,4 +266,276 @@ create or replace view query_timings as
      order by run, system, sf, job, query;
 
 
+create or replace view saturation_curve as
+     select run.name as run,
+            run.system as system,
+            saturation.name as job,
+            saturation.stage,
+            saturation.cpu,
+            round(saturation.qpm, 4) as qpm,
+            saturation.p95,
+            saturation.knee
+       from saturation
+            join job on job.id = saturation.job
+            join run on run.id = job.run
+   order by run.id, saturation.name, saturation.stage;
+
+
+--
+-- Power@Size is 3600 * SF divided by the geometric mean of the 22 queries
+-- and the 2 refresh functions timings of the power test, in seconds.
+--
+-- Query timings lower than 1/1000th of the longest query timing are
+-- increased to that value, as per the TPC-H specifications.
+--
+create or replace view power as
+     with timings as (
+         select job, name, extract(epoch from duration) as secs
+           from query
+      union all
+         select job, 'RF1', extract(epoch from rf1) from refresh
+      union all
+         select job, 'RF2', extract(epoch from rf2) from refresh
+     ),
+     clamped as (
+         select job, name,
+                greatest(secs,
+                         max(secs) filter(where name !~ '^RF')
+                                   over(partition by job) / 1000) as secs
+           from timings
+     )
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            tpch_test.sf,
+            job.duration,
+            round((  3600 * tpch_test.sf
+                   / exp(avg(ln(clamped.secs))))::numeric,
+                  2) as power
+       from tpch_test
+            join job on job.id = tpch_test.job
+            join run on run.id = job.run
+            join clamped on clamped.job = job.id
+      where tpch_test.test = 'power'
+   group by run.id, job.id, tpch_test.sf
+     having count(clamped.secs) = 24
+   order by run.id, job.start;
+
+
+--
+-- Throughput@Size is the number of queries executed in the throughput
+-- test per hour of its measurement interval Ts, times SF. Tests where some
+-- queries or refresh functions failed are not reported.
+--
+create or replace view throughput as
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            tpch_test.sf,
+            tpch_test.streams,
+            job.duration as ts,
+            round((  tpch_test.streams * 22 * 3600
+                   / extract(epoch from job.duration)
+                   * tpch_test.sf)::numeric,
+                  2) as throughput
+       from tpch_test
+            join job on job.id = tpch_test.job
+            join run on run.id = job.run
+      where tpch_test.test = 'throughput'
+        and (select count(*)
+               from query
+              where query.job = job.id) = tpch_test.streams * 22
+        and (select count(rf1) + count(rf2)
+               from refresh
+              where refresh.job = job.id) = tpch_test.streams * 2
+   order by run.id, job.start;
+
+
+--
+-- QphH@Size is the geometric mean of Power@Size and Throughput@Size
+--
+create or replace view qphh as
+     select run, system, sf,
+            power.job as power_job,
+            throughput.job as throughput_job,
+            power.power,
+            throughput.throughput,
+            round(sqrt(power.power * throughput.throughput), 2) as qphh
+       from power
+            join throughput using(run, system, sf)
+   order by run, system, sf;
+
+
+--
+-- refresh jobs apply refresh pairs along with stream jobs: compare the QPM
+-- of query jobs with how many refresh pairs were started meanwhile
+--
+create or replace view refresh_timings as
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            count(*) as pairs,
+            avg(refresh.rf1) as rf1,
+            avg(refresh.rf2) as rf2,
+            percentile_cont(0.95) within group(order by refresh.rf1) as rf1_95,
+            percentile_cont(0.95) within group(order by refresh.rf2) as rf2_95
+       from refresh
+            join job on job.id = refresh.job
+            join run on run.id = job.run
+   group by run.id, job.id
+   order by run.id, job.start;
+
+
+create or replace view qpm_under_refresh as
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            job.start,
+            job.duration,
+            count(query.id) as queries,
+            round((  count(query.id)
+                   / extract(epoch from job.duration)
+                   * 60)::numeric,
+                  4) as qpm,
+            (select count(*)
+               from refresh
+                    join job rj on rj.id = refresh.job
+              where rj.run = run.id
+                and refresh.start >= job.start
+                and refresh.start < job.start + job.duration) as refresh_pairs
+       from job
+            join run on run.id = job.run
+            join query on query.job = job.id
+   group by run.id, job.id
+   order by run.id, job.start;
+
+
+--
+-- Query timings percentiles computed from the histogram snapshots, merged
+-- together for the whole job, within 1% of the query_timings values. They
+-- are available even when the stream job doesn't keep raw query rows.
+--
+create or replace view histogram_timings as
+     with totals as (
+         select job,
+                name,
+                sum(count) as count,
+                sum(total) / sum(count) as average,
+                max(max) as max
+           from histogram
+       group by job, name
+     ),
+     cumulative as (
+         select job,
+                name,
+                b.bucket,
+                sum(sum(b.n)) over(partition by job, name
+                                   order by b.bucket) as below
+           from histogram,
+                unnest(buckets, counts) as b(bucket, n)
+       group by job, name, b.bucket
+     )
+     select run.name as run,
+            run.system as system,
+            job.name as jobname,
+            totals.name as query,
+            totals.count,
+            totals.average,
+            min(bucket) filter(where below >= 0.50 * totals.count)
+              * interval '1 us' as median,
+            min(bucket) filter(where below >= 0.90 * totals.count)
+              * interval '1 us' as "90%",
+            min(bucket) filter(where below >= 0.95 * totals.count)
+              * interval '1 us' as "95%",
+            min(bucket) filter(where below >= 0.98 * totals.count)
+              * interval '1 us' as "98%",
+            min(bucket) filter(where below >= 0.99 * totals.count)
+              * interval '1 us' as "99%",
+            totals.max
+       from totals
+            join cumulative using(job, name)
+            join job on job.id = totals.job
+            join run on run.id = job.run
+   group by run.id, job.id, totals.name,
+            totals.count, totals.average, totals.max
+   order by run.id, job.id, totals.name;
+
+
+--
+-- Stream jobs in the prepared mode split each query timing in the time
+-- spent planning the query and the time spent executing it.
+--
+create or replace view plan_timings as
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            query.name as query,
+            count(*) as count,
+            avg(query.duration) as average,
+            avg(query.plan_time) as plan,
+            avg(query.exec_time) as execute,
+            round((  sum(extract(epoch from query.plan_time))
+                   / sum(extract(epoch from query.duration))
+                   * 100)::numeric,
+                  2) as "plan%"
+       from query
+            join job on query.job = job.id
+            join run on job.run = run.id
+      where query.plan_time is not null
+   group by run.id, job.id, query.name
+   order by run.id, job.start, query.name::integer;
+
+
+--
+-- the ingest rate of each load job, with the scale factor reached at the
+-- end of the job, to see if loading slows down as the database grows
+--
+create or replace view ingest_rate as
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            job.steps[array_upper(job.steps, 1)] as sf,
+            job.duration,
+            sum(load_copy.rows) as rows,
+            pg_size_pretty(sum(load_copy.bytes)) as size,
+            round(sum(load_copy.rows)
+                  / nullif(extract(epoch from job.duration), 0)::numeric)
+              as rows_per_sec,
+            round(sum(load_copy.bytes) / (1024 * 1024)
+                  / nullif(extract(epoch from job.duration), 0)::numeric,
+                  2) as mb_per_sec
+       from load_copy
+            join job on job.id = load_copy.job
+            join run on run.id = job.run
+   group by run.id, job.id
+   order by run.id, job.start;
+
+
+--
+-- the throughput of a single COPY stream per table, for each load job
+--
+create or replace view table_throughput as
+     select run.name as run,
+            run.system as system,
+            job.name as job,
+            load_copy.relname,
+            count(*) as steps,
+            sum(load_copy.rows) as rows,
+            pg_size_pretty(sum(load_copy.bytes)) as size,
+            avg(load_copy.duration) as copy_time,
+            round(sum(load_copy.rows)
+                  / nullif(extract(epoch from sum(load_copy.duration)), 0)
+                    ::numeric)
+              as rows_per_sec,
+            round(sum(load_copy.bytes) / (1024 * 1024)
+                  / nullif(extract(epoch from sum(load_copy.duration)), 0)
+                    ::numeric,
+                  2) as mb_per_sec
+       from load_copy
+            join job on job.id = load_copy.job
+            join run on run.id = job.run
+   group by run.id, job.id, load_copy.relname
+   order by run.id, job.start, sum(load_copy.bytes) desc;
+
+
 commit;
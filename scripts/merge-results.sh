@@ -7,16 +7,30 @@ system=$2
 logdir=$3
 run=$4
 
-psql -X -a -d ${dbname} -f schema/tracking-merge-schema.sql
+# same steps as the streaming merge of tpch/control/merge.py, from the local
+# copy files of an imported archive
+psql -X -a -d ${dbname} -v ON_ERROR_STOP=1 <<EOF_MERGE
+begin;
 
-for table in run job query
-do
-    copy=${logdir}/${system}.${table}.copy
-    psql -X -a -d ${dbname} -c "copy merge.${table} from stdin" < ${copy}
-done
+\i schema/tracking-merge-schema.sql
 
-psql -X -a -d ${dbname} -f schema/tracking-merge-data.sql
-psql -X -a -d ${dbname} -c "drop schema merge cascade"
+\copy merge.run from ${logdir}/${system}.run.copy
+\copy merge.job from ${logdir}/${system}.job.copy
+\copy merge.query from ${logdir}/${system}.query.copy
+\copy merge.backlog from ${logdir}/${system}.backlog.copy
+\copy merge.saturation from ${logdir}/${system}.saturation.copy
+\copy merge.tpch_test from ${logdir}/${system}.tpch_test.copy
+\copy merge.refresh from ${logdir}/${system}.refresh.copy
+\copy merge.histogram from ${logdir}/${system}.histogram.copy
+\copy merge.load_step from ${logdir}/${system}.load_step.copy
+\copy merge.load_copy from ${logdir}/${system}.load_copy.copy
+
+\i schema/tracking-merge-data.sql
+
+drop schema merge cascade;
+
+commit;
+EOF_MERGE
 
 PAGER=cat psql -X -a -d ${dbname} <<EOF
   select run, system, count(*)
@@ -24,4 +38,3 @@ PAGER=cat psql -X -a -d ${dbname} <<EOF
    where run='${run}'
 group by run, system
 EOF
-
@@ -129,6 +129,13 @@ extern seed_t Seed[];
 #endif
 static int bTableSet = 0;
 
+/*
+ * refresh functions to run when generating updates, see -O i and -O d
+ */
+#define RF1_INSERTS	1
+#define RF2_DELETES	2
+static int refresh_functions = RF1_INSERTS | RF2_DELETES;
+
 
 /*
  * general table descriptions. See dss.h for details on structure
@@ -441,6 +448,7 @@ usage (void)
 	fprintf (stderr, "Basic Options\n===========================\n");
 	fprintf (stderr, "-C <n> -- separate data set into <n> chunks (requires -S, default: 1)\n");
 	fprintf (stderr, "-D     -- direct. Direct database load\n");
+	fprintf (stderr, "-B     -- binary. Use the binary COPY format with -D\n");
 	fprintf (stderr, "-n     -- database name, or connection string\n");
 	fprintf (stderr, "-f     -- force. Overwrite existing files\n");
 	fprintf (stderr, "-h     -- display this message\n");
@@ -453,6 +461,8 @@ usage (void)
 	fprintf (stderr, "-b <s> -- load distributions for <s> (default: dists.dss)\n");
     fprintf (stderr, "-d <n> -- split deletes between <n> files (requires -U)\n");
     fprintf (stderr, "-i <n> -- split inserts between <n> files (requires -U)\n");
+	fprintf (stderr, "-O i   -- generate the RF1 inserts ONLY (requires -U)\n");
+	fprintf (stderr, "-O d   -- generate the RF2 deletes ONLY (requires -U)\n");
 	fprintf (stderr, "-T c   -- generate cutomers ONLY\n");
 	fprintf (stderr, "-T l   -- generate nation/region ONLY\n");
 	fprintf (stderr, "-T L   -- generate lineitem ONLY\n");
@@ -508,7 +518,7 @@ process_options (int count, char **vector)
 	FILE *pF;
 
 	while ((option = getopt (count, vector,
-							 "b:C:d:Dfi:hn:O:P:qs:S:T:U:v")) != -1)
+							 "b:BC:d:Dfi:hn:O:P:qs:S:T:U:v")) != -1)
 		switch (option)
 		{
 			case 'b':				/* load distributions from named file */
@@ -533,6 +543,9 @@ process_options (int count, char **vector)
 			case 'D':				/* direct database load */
 				direct = 1;
 				break;
+			case 'B':				/* binary COPY for direct load */
+				copy_binary = 1;
+				break;
 			case 'f':				/* blind overwrites; Force */
 				force = 1;
 				break;
@@ -647,6 +660,12 @@ process_options (int count, char **vector)
 					case 's':			/* calibrate the RNG usage */
 						set_seeds = 1;
 						break;
+					case 'i':			/* RF1 only: new sales inserts */
+						refresh_functions = RF1_INSERTS;
+						break;
+					case 'd':			/* RF2 only: old sales deletes */
+						refresh_functions = RF2_DELETES;
+						break;
 					default:
 						fprintf (stderr, "Unknown option name %s\n",
 								 optarg);
@@ -726,6 +745,12 @@ void validate_options(void)
 		exit(-1);
 	}
 
+	if (!direct && copy_binary)
+	{
+		fprintf(stderr, "ERROR: -B is only valid when doing direct database load, see -D\n");
+		exit(-1);
+	}
+
 	return;
 }
 
@@ -749,6 +774,7 @@ main (int ac, char **av)
 		(1 << ORDER_LINE);
 	force = 0;
 	direct = 0;
+	copy_binary = 0;
     insert_segments=0;
     delete_segments=0;
     insert_orders_segment=0;
@@ -851,17 +877,17 @@ main (int ac, char **av)
 			insert_lineitem_segment=0;
 			delete_segment=0;
 			minrow = upd_num * rowcnt + 1;
-			gen_tbl (ORDER_LINE, minrow, rowcnt, upd_num + 1);
+			if (refresh_functions & RF1_INSERTS)
+				gen_tbl (ORDER_LINE, minrow, rowcnt, upd_num + 1);
 			if (verbose > 0)
 				fprintf (stderr, "done.\n");
 
-			if (direct)
+			if (refresh_functions & RF2_DELETES)
 			{
-				ld_drange (ORDER_LINE, minrow, rowcnt, upd_num + 1);
-			}
-			else
-			{
-				pr_drange (ORDER_LINE, minrow, rowcnt, upd_num + 1);
+				if (direct)
+					ld_drange (ORDER_LINE, minrow, rowcnt, upd_num + 1);
+				else
+					pr_drange (ORDER_LINE, minrow, rowcnt, upd_num + 1);
 			}
 			upd_num++;
 		}
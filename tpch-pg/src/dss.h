@@ -284,6 +284,7 @@ EXTERN int  step;
 EXTERN int	set_seeds;
 EXTERN char *d_path;
 EXTERN char *db_name;
+EXTERN long copy_binary;
 
 /* added for segmented updates */
 EXTERN int insert_segments;
@@ -494,6 +495,7 @@ int dbg_print(int dt, FILE *tgt, void *data, int len, int eol);
 #endif /* DATE_FORMAT */
 
 int pg_append(int format, PQExpBuffer buffer, void *data, int len, int sep);
+void startrow(PGconn *conn, PQExpBuffer buffer);
 #define LD_STR(f, str, len)		pg_append(DT_STR, f, (void *)str, len, 1)
 #define LD_VSTR(f, str, len) 	pg_append(DT_VSTR, f, (void *)str, len, 1)
 #define LD_VSTR_LAST(f, str, len) 	pg_append(DT_VSTR, f, (void *)str, len, 0)
@@ -502,7 +504,7 @@ int pg_append(int format, PQExpBuffer buffer, void *data, int len, int sep);
 #define LD_KEY(f, str) 			pg_append(DT_KEY, f, (void *)str, 0, -1)
 #define LD_MONEY(f, str) 		pg_append(DT_MONEY, f, (void *)str, 0, 1)
 #define LD_CHR(f, str)	 		pg_append(DT_CHR, f, (void *)str, 0, 1)
-#define  LD_STRT(fp)            fp = createPQExpBuffer()
+#define  LD_STRT(fp)            { fp = createPQExpBuffer(); startrow(conn, fp); }
 #define  LD_END(fp) { pg_append(DT_EOL, fp, NULL, 0, 0); copyrow(conn, fp); destroyPQExpBuffer(fp); }
 
 #ifdef MDY_DATE
@@ -29,6 +29,9 @@
  */
 
 #include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <sys/time.h>
 #include "config.h"
 #include "dss.h"
 #include "dsstypes.h"
@@ -37,6 +40,111 @@
 
 int ld_drange PROTO((int tbl, DSS_HUGE min, DSS_HUGE cnt, long num));
 
+/*
+ * We count the rows and bytes sent in each COPY stream, and print them on
+ * stdout when the stream is done, for the driver to track the load
+ * throughput of each table:
+ *
+ *   copy <table> <rows> <bytes> <seconds>
+ *
+ * With -B the rows are sent in the binary COPY format, where each field is
+ * sent in the binary representation of its column type, as found in the
+ * catalogs when opening the stream. The server then doesn't have to parse
+ * the text of billions of numbers and dates.
+ */
+#define MAX_COPIES 8
+#define MAX_COLUMNS 32
+
+/* pg_type oids, see src/include/catalog/pg_type.dat */
+#define INT8OID		20
+#define INT2OID		21
+#define INT4OID		23
+#define TEXTOID		25
+#define FLOAT4OID	700
+#define FLOAT8OID	701
+#define BPCHAROID	1042
+#define VARCHAROID	1043
+#define DATEOID		1082
+#define NUMERICOID	1700
+
+#define NUMERIC_POS	0x0000
+#define NUMERIC_NEG	0x4000
+
+/* the binary COPY header: signature, flags, header extension length */
+static const char binary_signature[] = "PGCOPY\n\377\r\n";
+
+typedef struct copy_stream
+{
+	PGconn	   *conn;
+	const char *tablename;
+	long long	rows;
+	long long	bytes;
+	struct timeval start;
+
+	/* column types, for the binary format */
+	int			natts;
+	Oid			types[MAX_COLUMNS];
+	int			field;
+} copy_stream;
+
+static copy_stream copies[MAX_COPIES];
+
+/* the stream of the row being built, rows are built one at a time */
+static copy_stream *current = NULL;
+
+static copy_stream *
+get_copy_stream(PGconn *conn)
+{
+	int i;
+
+	for (i = 0; i < MAX_COPIES; i++)
+	{
+		if (copies[i].conn == conn)
+			return &copies[i];
+	}
+	return NULL;
+}
+
+static copy_stream *
+start_copy_stream(PGconn *conn, const char *tablename)
+{
+	copy_stream *stream = get_copy_stream(NULL);
+
+	if (stream == NULL)
+	{
+		fprintf(stderr, "COPY command failed: too many COPY streams\n");
+		exit(-2);
+	}
+
+	stream->conn = conn;
+	stream->tablename = tablename;
+	stream->rows = 0;
+	stream->bytes = 0;
+	stream->natts = 0;
+	gettimeofday(&stream->start, NULL);
+
+	return stream;
+}
+
+static void
+print_copy_stats(copy_stream *stream)
+{
+	struct timeval end;
+
+	if (stream == NULL)
+		return;
+
+	gettimeofday(&end, NULL);
+
+	printf("copy %s %lld %lld %.6f\n",
+		   stream->tablename, stream->rows, stream->bytes,
+		   (end.tv_sec - stream->start.tv_sec)
+		   + (end.tv_usec - stream->start.tv_usec) / 1e6);
+	fflush(stdout);
+
+	stream->conn = NULL;
+}
+
 static void
 exit_nicely(PGconn *conn)
 {
@@ -99,15 +207,125 @@ commit_and_close(PGconn *conn)
 }
 
 
+/*
+ * Fetch the column types of TABLENAME, for the binary COPY format.
+ */
+static void
+fetch_column_types(PGconn *conn, copy_stream *stream)
+{
+	PGresult   *res;
+	PQExpBuffer q = createPQExpBuffer();
+	int i;
+
+	printfPQExpBuffer(q,
+					  "SELECT atttypid FROM pg_attribute "
+					  "WHERE attrelid = '%s'::regclass "
+					  "AND attnum > 0 AND NOT attisdropped "
+					  "ORDER BY attnum;",
+					  stream->tablename);
+
+	res = PQexec(conn, q->data);
+	destroyPQExpBuffer(q);
+
+	if (PQresultStatus(res) != PGRES_TUPLES_OK)
+	{
+		fprintf(stderr, "SELECT command failed: %s", PQerrorMessage(conn));
+		PQclear(res);
+		exit_nicely(conn);
+	}
+
+	if (PQntuples(res) > MAX_COLUMNS)
+	{
+		fprintf(stderr, "COPY command failed: %s has more than %d columns\n",
+				stream->tablename, MAX_COLUMNS);
+		PQclear(res);
+		exit_nicely(conn);
+	}
+
+	stream->natts = PQntuples(res);
+
+	for (i = 0; i < stream->natts; i++)
+	{
+		stream->types[i] = (Oid) strtoul(PQgetvalue(res, i, 0), NULL, 10);
+	}
+	PQclear(res);
+}
+
+
+static void
+put_copy_data(PGconn *conn, const char *data, int len)
+{
+	int status = PQputCopyData(conn, data, len);
+
+	if (status == -1)
+	{
+        fprintf(stderr, "COPY command failed: %s", PQerrorMessage(conn));
+        exit_nicely(conn);
+	}
+	else if (status == 0)
+	{
+        fprintf(stderr, "COPY command failed: full buffers!");
+        exit_nicely(conn);
+	}
+	return;
+}
+
+
+static void
+append_int16(PQExpBuffer buffer, int value)
+{
+	char bytes[2];
+
+	bytes[0] = (value >> 8) & 0xFF;
+	bytes[1] = value & 0xFF;
+
+	appendBinaryPQExpBuffer(buffer, bytes, 2);
+}
+
+
+static void
+append_int32(PQExpBuffer buffer, long value)
+{
+	char bytes[4];
+	int i;
+
+	for (i = 0; i < 4; i++)
+		bytes[i] = (value >> (8 * (3 - i))) & 0xFF;
+
+	appendBinaryPQExpBuffer(buffer, bytes, 4);
+}
+
+
+static void
+append_int64(PQExpBuffer buffer, long long value)
+{
+	char bytes[8];
+	int i;
+
+	for (i = 0; i < 8; i++)
+		bytes[i] = (value >> (8 * (7 - i))) & 0xFF;
+
+	appendBinaryPQExpBuffer(buffer, bytes, 8);
+}
+
+
 PGconn *
 prep_direct(const char *tablename)
 {
 	PGconn     *conn = open_pgconn_and_begin();
 	PGresult   *res;
 	PQExpBuffer q = createPQExpBuffer();
+	copy_stream *stream = start_copy_stream(conn, tablename);
 
 	/* Open the COPY stream */
-	printfPQExpBuffer(q, "COPY %s FROM STDIN;", tablename);
+	if (copy_binary)
+	{
+		fetch_column_types(conn, stream);
+		printfPQExpBuffer(q, "COPY %s FROM STDIN WITH (FORMAT binary);",
+						  tablename);
+	}
+	else
+		printfPQExpBuffer(q, "COPY %s FROM STDIN;", tablename);
 
     res = PQexec(conn, q->data);
 
@@ -119,6 +337,19 @@ prep_direct(const char *tablename)
     }
     PQclear(res);
 
+	if (copy_binary)
+	{
+		/* signature, no flags, no header extension */
+		resetPQExpBuffer(q);
+		appendBinaryPQExpBuffer(q, binary_signature,
+								sizeof(binary_signature));
+		append_int32(q, 0);
+		append_int32(q, 0);
+
+		put_copy_data(conn, q->data, q->len);
+	}
+	destroyPQExpBuffer(q);
+
     return conn;
 }
 
@@ -127,8 +358,19 @@ int
 close_direct(PGconn *conn)
 {
 	PGresult   *res;
+	copy_stream *stream;
 	int status;
 
+	/* the binary format has a trailer */
+	if (copy_binary)
+	{
+		PQExpBuffer q = createPQExpBuffer();
+
+		append_int16(q, -1);
+		put_copy_data(conn, q->data, q->len);
+		destroyPQExpBuffer(q);
+	}
+
 	/* end the current COPY stream */
 	status = PQputCopyEnd(conn, NULL);
 
@@ -153,36 +395,290 @@ close_direct(PGconn *conn)
     PQclear(res);
 
     /* end the transaction and close the connection */
+	stream = get_copy_stream(conn);
 	commit_and_close(conn);
 
+	/* only now are the rows in the database */
+	print_copy_stats(stream);
+
     return(0);
 }
 
 
+/*
+ * Begin a new row of the COPY stream of CONN in BUFFER.
+ */
+void
+startrow(PGconn *conn, PQExpBuffer buffer)
+{
+	current = get_copy_stream(conn);
+	current->field = 0;
+
+	/* the binary format begins a row with its number of fields */
+	if (copy_binary)
+		append_int16(buffer, current->natts);
+}
+
+
 void
 copyrow(PGconn *conn, PQExpBuffer buffer)
 {
-	int status = PQputCopyData(conn, buffer->data, buffer->len);
+	copy_stream *stream = get_copy_stream(conn);
 
-	if (status == -1)
+	if (copy_binary && stream->field != stream->natts)
 	{
-        fprintf(stderr, "COPY command failed: %s", PQerrorMessage(conn));
-        exit_nicely(conn);
+		fprintf(stderr, "COPY command failed: %d fields for the %d columns "
+				"of %s\n", stream->field, stream->natts, stream->tablename);
+		exit_nicely(conn);
 	}
-	else if (status == 0)
+
+	put_copy_data(conn, buffer->data, buffer->len);
+
+	stream->rows++;
+	stream->bytes += buffer->len;
+
+	return;
+}
+
+
+/*
+ * Return the number of days from 2000-01-01 to the date TEXT, as stored in
+ * the binary format of the date type. See date2j in PostgreSQL.
+ */
+static long
+date_to_pg(const char *text)
+{
+	int year, month, day, century;
+	long julian;
+
+	if (sscanf(text, "%d-%d-%d", &year, &month, &day) != 3)
 	{
-        fprintf(stderr, "COPY command failed: full buffers!");
-        exit_nicely(conn);
+		fprintf(stderr, "COPY command failed: invalid date \"%s\"\n", text);
+		exit(-2);
 	}
-	return;
+
+	if (month > 2)
+	{
+		month += 1;
+		year += 4800;
+	}
+	else
+	{
+		month += 13;
+		year += 4799;
+	}
+
+	century = year / 100;
+	julian = year * 365 - 32167;
+	julian += year / 4 - century + century / 4;
+	julian += 7834 * month / 256 + day;
+
+	/* 2451545 is the julian day of 2000-01-01 */
+	return julian - 2451545;
+}
+
+
+/*
+ * Append VALUE / 10^DSCALE in the binary format of the numeric type: a
+ * header, then digits in base 10000, the first one having the weight
+ * WEIGHT, that is 10000^WEIGHT. DSCALE is at most 4.
+ */
+static void
+append_numeric(PQExpBuffer buffer, DSS_HUGE value, int dscale)
+{
+	int digits[8];
+	int ndigits = 0, nint = 0, i;
+	int sign = NUMERIC_POS;
+	DSS_HUGE pow = 1, ipart, frac;
+
+	for (i = 0; i < dscale; i++)
+		pow *= 10;
+
+	if (value < 0)
+	{
+		sign = NUMERIC_NEG;
+		value = -value;
+	}
+
+	ipart = value / pow;
+	frac = value % pow;
+
+	/* integer part, least significant digits first */
+	for (; ipart > 0; ipart /= 10000)
+		digits[nint++] = ipart % 10000;
+
+	/* put the integer digits in the right order */
+	for (i = 0; i < nint / 2; i++)
+	{
+		int tmp = digits[i];
+
+		digits[i] = digits[nint - 1 - i];
+		digits[nint - 1 - i] = tmp;
+	}
+	ndigits = nint;
+
+	if (frac > 0)
+	{
+		for (i = dscale; i < 4; i++)
+			frac *= 10;
+		digits[ndigits++] = frac;
+	}
+
+	append_int32(buffer, 8 + 2 * ndigits);
+	append_int16(buffer, ndigits);
+	append_int16(buffer, ndigits == 0 ? 0 : nint - 1);
+	append_int16(buffer, ndigits == 0 ? NUMERIC_POS : sign);
+	append_int16(buffer, dscale);
+
+	for (i = 0; i < ndigits; i++)
+		append_int16(buffer, digits[i]);
 }
 
+
+/*
+ * Append the field DATA to BUFFER in the binary format of the type of the
+ * current column: the length of the field then its value.
+ */
+static int
+pg_append_binary(int format, PQExpBuffer buffer, void *data, int len)
+{
+	Oid type;
+	DSS_HUGE value = 0;
+	int dscale = 0;
+	const char *text = NULL;
+	char chr;
+
+	if (format == DT_EOL)
+		return(0);
+
+	if (current->field >= current->natts)
+	{
+		fprintf(stderr, "COPY command failed: too many fields for %s\n",
+				current->tablename);
+		exit(-2);
+	}
+	type = current->types[current->field++];
+
+	switch(format)
+	{
+		case DT_STR:
+			text = (char *)data;
+			break;
+		case DT_INT:
+		case DT_KEY:
+			value = (long)data;
+			break;
+		case DT_HUGE:
+			value = *(DSS_HUGE *)data;
+			break;
+		case DT_MONEY:
+			value = *(DSS_HUGE *)data;
+			dscale = 2;
+			break;
+		case DT_CHR:
+			chr = *(char *)data;
+			break;
+	}
+
+	switch(type)
+	{
+		case INT2OID:
+		case INT4OID:
+		case INT8OID:
+			if (text != NULL || format == DT_CHR || dscale != 0)
+				break;
+
+			if (type == INT2OID)
+			{
+				append_int32(buffer, 2);
+				append_int16(buffer, value);
+			}
+			else if (type == INT4OID)
+			{
+				append_int32(buffer, 4);
+				append_int32(buffer, value);
+			}
+			else
+			{
+				append_int32(buffer, 8);
+				append_int64(buffer, value);
+			}
+			return(0);
+
+		case FLOAT4OID:
+		case FLOAT8OID:
+		{
+			double d = dscale ? value / 100.0 : (double) value;
+			union { float f; int32_t i; } f4;
+			union { double d; int64_t i; } f8;
+
+			if (text != NULL || format == DT_CHR)
+				break;
+
+			if (type == FLOAT4OID)
+			{
+				f4.f = (float) d;
+				append_int32(buffer, 4);
+				append_int32(buffer, f4.i);
+			}
+			else
+			{
+				f8.d = d;
+				append_int32(buffer, 8);
+				append_int64(buffer, f8.i);
+			}
+			return(0);
+		}
+
+		case NUMERICOID:
+			if (text != NULL || format == DT_CHR)
+				break;
+
+			append_numeric(buffer, value, dscale);
+			return(0);
+
+		case DATEOID:
+			if (text == NULL)
+				break;
+
+			append_int32(buffer, 4);
+			append_int32(buffer, date_to_pg(text));
+			return(0);
+
+		case BPCHAROID:
+		case VARCHAROID:
+		case TEXTOID:
+			if (format == DT_CHR)
+			{
+				append_int32(buffer, 1);
+				appendBinaryPQExpBuffer(buffer, &chr, 1);
+				return(0);
+			}
+
+			if (text == NULL)
+				break;
+
+			append_int32(buffer, strlen(text));
+			appendBinaryPQExpBuffer(buffer, text, strlen(text));
+			return(0);
+	}
+
+	fprintf(stderr, "COPY command failed: can't send field %d of %s as "
+			"type %u in binary format\n",
+			current->field, current->tablename, type);
+	exit(-2);
+}
+
+
 int
 pg_append(int format, PQExpBuffer buffer, void *data, int len, int sep)
 {
 	int dollars,
 		cents;
 
+	if (copy_binary)
+		return pg_append_binary(format, buffer, data, len);
+
 	switch(format)
 	{
 		case DT_STR:
@@ -587,5 +1083,10 @@ ld_drange(int tbl, DSS_HUGE min, DSS_HUGE cnt, long num)
 		last = new;
 	}
 
+	/* the update set is complete, don't leave it uncommitted at exit */
+	commit_and_close(conn);
+	conn = NULL;
+	last_num = 0;
+
     return(0);
 }
@@ -10,7 +10,9 @@ from service import find_syslog, Service
 from tpch.run import logs
 from tpch.run import utils
 from tpch.run import setup
+from tpch.run import corpus as qcorpus
 from tpch.run.schedule import Schedule
+from tpch.run.tracking import Tracking
 
 import click
 import os.path
@@ -67,6 +69,41 @@ def benchmark(system, name, schedule, kind, dsn, ini, log, debug, detach):
         bench.run(name, schedule)
 
 
+@cli.command()
+@click.option("--ini", default=CONF, type=click.Path(exists=True))
+@click.option("--variants", default=10)
+@click.option("--seed", type=int)
+@click.option("--name")
+def corpus(name, seed, variants, ini):
+    """Pre-generate the query corpus of a run NAME, or for a given SEED"""
+    conf = setup.Setup(ini)
+
+    if seed is None:
+        if name is None:
+            raise click.UsageError("either --name or --seed is needed")
+        seed = qcorpus.run_seed(name)
+
+    c = qcorpus.Corpus.load(seed, conf.scale.factor, variants)
+    click.echo("%s: %d variants of %d queries, seed %d" %
+               (os.path.normpath(c.filename(seed, conf.scale.factor)),
+                c.variants, len(c.queries), seed))
+
+
+@cli.command()
+@click.option("--ini", default=CONF, type=click.Path(exists=True))
+@click.option("--name", required=True)
+def sync(name, ini):
+    """Replay the tracking journal of the run NAME in the results database"""
+    conf = setup.Setup(ini)
+
+    track = Tracking(conf, None, name)
+    count = track.sync()
+    track.close()
+
+    click.echo("%s: replayed %d events from %s" %
+               (name, count, os.path.normpath(track.journal.filename)))
+
+
 @cli.command()
 @click.option('--grammar', default='adverbs verbs')
 def name(grammar):
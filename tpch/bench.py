@@ -1,19 +1,45 @@
 import os
 import os.path
 import logging
+import threading
 import psycopg2
 import humanize
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from . import system
 from .control import setup
 from .control import utils
 from .run import setup as sched
 from .infra import setup as infra
+from .infra import ready
 
 RUNFILE = 'run.ini'
-CLEAN_RESULTS  = 'psql -a -d %s -v run=%s -f '
-CLEAN_RESULTS += os.path.relpath(
-    os.path.join(utils.TOPDIR, 'schema', 'tracking-delete-run.sql'))
+
+# orchestration steps run on all the systems at once, in threads: they are
+# mostly waiting for AWS, ssh and rsync
+MAX_WORKERS = 8
+
+# the system being orchestrated by the current thread, if any
+CONTEXT = threading.local()
+
+
+class SystemPrefix(logging.Filter):
+    "Prefix log messages with the system name of the current thread."
+    def filter(self, record):
+        name = getattr(CONTEXT, 'system', None)
+
+        if name:
+            msg = record.getMessage()
+            if not msg.startswith('%s:' % name) \
+               and not msg.startswith('%s ' % name):
+                record.msg = '%s: %s' % (name, msg)
+                record.args = ()
+
+        return True
+
+
+logging.getLogger('TPCH').addFilter(SystemPrefix())
 
 
 class Run():
@@ -27,6 +53,9 @@ class Run():
 
         self.log = logging.getLogger('TPCH')
 
+        # the systems that failed to prepare, start() skips them
+        self.failed = []
+
         if self.conf.run:
             self.schedule = self.conf.run.schedule
             self.sysnames = self.conf.run.systems
@@ -74,6 +103,38 @@ class Run():
             raise ValueError("Unknown benchmark schedule/job %s",
                              self.schedule)
 
+    def each_system(self, step, fun, systems=None):
+        """Call FUN on all our systems concurrently, or only on SYSTEMS, and
+        return the list of the systems where it failed. A failure is logged
+        and doesn't stop the other systems.
+
+        """
+        systems = self.systems if systems is None else systems
+
+        def run(s):
+            CONTEXT.system = s.name
+            try:
+                return fun(s)
+            finally:
+                CONTEXT.system = None
+
+        failed = []
+        workers = max(1, min(MAX_WORKERS, len(systems)))
+
+        with ThreadPoolExecutor(workers) as executor:
+            futures = {executor.submit(run, s): s for s in systems}
+
+            for future in as_completed(futures):
+                s = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    self.log.error('%s: %s failed on system %s: %s',
+                                   self.name, step, s.name, e)
+                    failed.append(s)
+
+        return failed
+
     def has_infra(self):
         return any([s.has_infra() for s in self.systems])
 
@@ -126,33 +187,55 @@ class Run():
 
     def prepare(self):
         self.log.info('%s: preparing the infra' % self.name)
-        for s in self.systems:
+
+        def prepare(s):
             self.log.info('%s: preparing system %s' % (self.name, s.name))
             s.prepare()
 
+            self.log.info('%s: waiting for infra services to be ready'
+                          % self.name)
+            s.prepare_loader()
+
+        self.failed = self.each_system('prepare', prepare)
+
         # wait until all sytems are ready, to start tests roughly
-        self.log.info('%s: waiting for infra services to be ready' % self.name)
+        owners = {}
+        resources = []
         for s in self.systems:
-            s.prepare_loader()
+            if s not in self.failed:
+                for name, fun in s.resources():
+                    owners[name] = s
+                    resources.append((name, fun))
 
-        wait = set(self.systems)
-        while wait:
-            # avoid looping over the wait set object, which we are modifying
-            # within the loop we expect 1..4 systems here anyway
-            for s in self.systems:
-                if s in wait and s.is_ready():
-                    wait.remove(s)
+        timeline = ready.wait_all(resources)
+
+        print()
+        print("%30s | %12s | %s" % ("Resource", "Ready after", "Error"))
+        print("%30s-|-%12s-|-%s" % ("-" * 30, "-" * 12, "-" * 20))
+        for name, secs, err in timeline:
+            print("%30s | %12s | %s" % (name, "%.1fs" % secs, err or ""))
+
+            # a system with a resource that's not ready is failed too
+            if err and owners[name] not in self.failed:
+                self.failed.append(owners[name])
+        print()
 
     def start(self, schedule):
         # now run the benchmarks on all systems in parallel
         if schedule:
             self.schedule = schedule
 
-        for s in self.systems:
+        def start(s):
             self.log.info('%s: starting benchmark schedule "%s" on system %s'
                           % (self.name, self.schedule, s.name))
             s.start()
 
+        for s in self.failed:
+            self.log.error('%s: skipping system %s, it failed to prepare'
+                           % (self.name, s.name))
+
+        self.each_system('start', start,
+                         [s for s in self.systems if s not in self.failed])
         return
 
     def results(self, verbose=False):
@@ -279,20 +362,22 @@ with ten as (
 
         return
 
-    def tail(self, follow=False, n=10):
+    def tail(self, follow=False, n=10, pattern=None):
         self.log.info("tail %s logs" % (self.name))
 
         if follow:
-            tails = utils.roundrobin([s.tail(True)
-                                      for s in self.systems
-                                      if s.is_ready()],
-                                     n)
-            for line in tails:
-                print(line)
+            remotes = [s.tail(True, n) for s in self.systems if s.is_ready()]
+
+            # a system can stop being ready in between, tail() is then None
+            remotes = [remote for remote in remotes if remote is not None]
+
+            # print lines from any system as soon as they are available
+            for name, line in utils.multitail(remotes, pattern):
+                print("%s: %s" % (name, line))
 
         else:
             for s in self.systems:
-                s.tail(n=n)
+                s.tail(n=n, pattern=pattern)
                 print()
 
     def is_ready(self):
@@ -305,13 +390,8 @@ with ten as (
 
         self.log.info("update %s logs and results", self.name)
 
-        command = CLEAN_RESULTS % (self.resdb, self.name)
-        self.log.info("Clean-up previous round of results first…")
-        self.log.info(command)
-        utils.run_command('Clean-up', command)
-
-        for s in self.systems:
-                s.update(self.resdb)
+        # results are merged incrementally, see tracking-merge-data.sql
+        self.each_system('update', lambda s: s.update(self.resdb))
 
         if tail:
             for s in self.systems:
@@ -330,18 +410,16 @@ with ten as (
 
     def merge_results(self):
         self.log.info("Merging results for %s", self.name)
-        for s in self.systems:
-            s.merge_results(self.resdb)
+        self.each_system('merge results',
+                         lambda s: s.merge_results(self.resdb))
 
     def cancel(self, system=None):
         self.log.info("Cancelling loaders for %s", self.name)
-        for s in self.systems:
-            s.cancel()
+        self.each_system('cancel', lambda s: s.cancel())
 
     def terminate(self):
         self.log.info("Terminating the whole infra for %s", self.name)
-        for s in self.systems:
-            s.terminate()
+        self.each_system('terminate', lambda s: s.terminate())
 
         self.list_infra()
         return
@@ -0,0 +1,109 @@
+import os.path
+import psycopg2
+
+from . import utils
+
+# The loader dumps its results as a single stream, see
+# schema/tracking-dump.sql, that we read over ssh and copy straight into
+# the merge schema of the results database, then merge in the same
+# transaction. No files, no psql.
+SCHEMA_DIR   = os.path.join(utils.TOPDIR, 'schema')
+MERGE_SCHEMA = os.path.join(SCHEMA_DIR, 'tracking-merge-schema.sql')
+MERGE_DATA   = os.path.join(SCHEMA_DIR, 'tracking-merge-data.sql')
+
+TABLES = ['run', 'job', 'query', 'backlog',
+          'saturation', 'tpch_test', 'refresh', 'histogram', 'load_step',
+          'load_copy']
+
+END_OF_DATA = b'\\.\n'
+CHUNK_SIZE  = 64 * 1024
+
+
+class CopySection():
+    """A file-like object that reads the rows of one table of the dump, up to
+    its end of data marker, for psycopg2's copy_expert.
+
+    The rows are also written to the ARCHIVE file object, when given.
+
+    """
+    def __init__(self, stream, archive=None):
+        self.stream = stream
+        self.archive = archive
+        self.rows = 0
+        self.bytes = 0
+        self.done = False
+
+    def read(self, size=CHUNK_SIZE):
+        lines = []
+        length = 0
+
+        while not self.done and length < size:
+            line = self.stream.readline()
+
+            if not line.endswith(b'\n'):
+                raise RuntimeError("results dump ended unexpectedly")
+
+            if line == END_OF_DATA:
+                self.done = True
+            else:
+                lines.append(line)
+                length += len(line)
+                self.rows += 1
+
+        data = b''.join(lines)
+        self.bytes += length
+
+        if self.archive:
+            self.archive.write(data)
+
+        return data
+
+
+def read_sql(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+def merge(resdb, stream, archive=None, check=None):
+    """Merge the results dump read from STREAM, a binary file object, into
+    the RESDB database, in a single transaction.
+
+    ARCHIVE is a dict of table name to a file object where to keep a copy of
+    the rows, and CHECK is called once the whole stream has been read, so
+    that it may raise an exception and cancel the merge. Return a dict of
+    table name to the count of rows read.
+
+    """
+    archive = archive or {}
+    rows = {}
+
+    conn = psycopg2.connect(resdb)
+    try:
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute(read_sql(MERGE_SCHEMA))
+
+                while True:
+                    line = stream.readline()
+                    if not line:
+                        break
+
+                    table = line.decode('utf-8').strip()
+                    if table not in TABLES:
+                        raise RuntimeError(
+                            "unexpected table in results dump: %r" % table)
+
+                    section = CopySection(stream, archive.get(table))
+                    curs.copy_expert('copy merge.%s from stdin' % table,
+                                     section, size=CHUNK_SIZE)
+                    rows[table] = section.rows
+
+                if check:
+                    check()
+
+                curs.execute(read_sql(MERGE_DATA))
+                curs.execute('drop schema merge cascade')
+    finally:
+        conn.close()
+
+    return rows
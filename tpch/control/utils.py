@@ -1,14 +1,17 @@
 import os
+import re
 import shutil
 import os.path
 import time
 import shlex
+import atexit
 import logging
+import selectors
 import subprocess
+import threading
 import psycopg2
 
 from pathlib import Path
-from itertools import chain, cycle, islice
 from paramiko.client import SSHClient, MissingHostKeyPolicy
 
 TOPDIR  = os.path.join(os.path.dirname(__file__), '..', '..')
@@ -18,6 +21,16 @@ RESDB_SCHEMA = os.path.join(TOPDIR, 'schema', 'tracking.sql')
 RESDB_PSQL   = 'psql -X -a -d %%s -f %s' % RESDB_SCHEMA
 
 REMOTE_USER = 'ec2-user'
+STREAM_BUFSIZE = 64 * 1024
+
+# remote tails read their output in chunks, and cut very long lines
+READ_SIZE = 64 * 1024
+MAX_LINE  = 64 * 1024
+
+# pooled ssh connections, see SSHPool
+SSH_IDLE      = 300
+SSH_KEEPALIVE = 30
+
 RSYNC_OPTS  = '--exclude-from "rsync.exclude"'
 RSYNC_OPTS += ' -e "ssh -o StrictHostKeyChecking=no"'
 RSYNC_OPTS += ' -avz'
@@ -124,17 +137,101 @@ class IgnoreHostKeyPolicy(MissingHostKeyPolicy):
         return
 
 
-def execute_remote_command(ip, command, quiet=False, username=REMOTE_USER):
-    client = SSHClient()
-    client.set_missing_host_key_policy(IgnoreHostKeyPolicy)
-    client.connect(ip, username=username)
-    stdin, stdout, stderr = client.exec_command(command)
+class SSHPool():
+    """Keep one authenticated ssh connection per host and user, and open
+    the channels of all our remote commands, SFTP sessions and tails on it,
+    rather than doing a full ssh handshake for each command.
+
+    A connection is closed once it has been unused for IDLE seconds, and the
+    transport sends a keepalive every KEEPALIVE seconds so that long running
+    commands (tail -f) are not dropped by the network in between.
+
+    """
+    def __init__(self, idle=SSH_IDLE, keepalive=SSH_KEEPALIVE):
+        self.idle = idle
+        self.keepalive = keepalive
+        self.lock = threading.Lock()
+
+        # (ip, username) -> [client, users, last_used]
+        self.clients = {}
+
+    def acquire(self, ip, username=REMOTE_USER):
+        "Return a connected SSHClient for IP, to release() when done."
+        key = (ip, username)
+
+        with self.lock:
+            self.expire()
+
+            entry = self.clients.get(key)
+
+            if entry and self.is_active(entry[0]):
+                entry[1] += 1
+                return entry[0]
+
+        # connect without holding the lock, the handshake takes a while
+        client = SSHClient()
+        client.set_missing_host_key_policy(IgnoreHostKeyPolicy)
+        client.connect(ip, username=username)
+        client.get_transport().set_keepalive(self.keepalive)
+
+        with self.lock:
+            entry = self.clients.get(key)
+
+            if entry and self.is_active(entry[0]):
+                # another thread connected to the same host meanwhile
+                client.close()
+            else:
+                if entry:
+                    # the remote end went away, forget about it
+                    entry[0].close()
 
-    rc = stdout.channel.recv_exit_status()
-    out = stdout.read().decode('utf-8').splitlines()
-    err = stderr.read().decode('utf-8').splitlines()
+                entry = [client, 0, time.monotonic()]
+                self.clients[key] = entry
 
-    client.close()
+            entry[1] += 1
+            return entry[0]
+
+    def is_active(self, client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def release(self, ip, username=REMOTE_USER):
+        with self.lock:
+            entry = self.clients.get((ip, username))
+            if entry:
+                entry[1] = max(0, entry[1] - 1)
+                entry[2] = time.monotonic()
+
+    def expire(self):
+        now = time.monotonic()
+
+        for key, (client, users, last_used) in list(self.clients.items()):
+            if users == 0 and now - last_used > self.idle:
+                client.close()
+                del self.clients[key]
+
+    def close(self):
+        with self.lock:
+            for client, _, _ in self.clients.values():
+                client.close()
+            self.clients = {}
+
+
+# shared by System, PgSQL and the remote sessions, commands and tails
+POOL = SSHPool()
+atexit.register(POOL.close)
+
+
+def execute_remote_command(ip, command, quiet=False, username=REMOTE_USER):
+    client = POOL.acquire(ip, username)
+    try:
+        stdin, stdout, stderr = client.exec_command(command)
+
+        rc = stdout.channel.recv_exit_status()
+        out = stdout.read().decode('utf-8').splitlines()
+        err = stderr.read().decode('utf-8').splitlines()
+    finally:
+        POOL.release(ip, username)
 
     if rc != 0 and not quiet:
         log = logging.getLogger('TPCH')
@@ -156,62 +253,61 @@ def execute_remote_command(ip, command, quiet=False, username=REMOTE_USER):
 
 class RemoteSession():
     def __init__(self, ip, username=REMOTE_USER):
+        self.ip = ip
         self.username = username
 
-        self.client = SSHClient()
-        self.client.set_missing_host_key_policy(IgnoreHostKeyPolicy)
-        self.client.connect(ip, username=self.username)
-
+        self.client = POOL.acquire(ip, username)
         self.sftp = self.client.open_sftp()
 
-
-    def execute(self, command):
-        stdin, stdout, stderr = self.client.exec_command(command)
-
-        rc = stdout.channel.recv_exit_status()
-        out = stdout.read().decode('utf-8').splitlines()
-        err = stderr.read().decode('utf-8').splitlines()
-
-        if rc != 0 and not quiet:
-            log = logging.getLogger('TPCH')
-
-            log.error("ssh command returned %d" % rc)
-            log.error("ssh -l %s %s %s" % (self.username, ip, command))
-            print(command)
-            for line in out:
-                print(line)
-            for line in err:
-                print(line)
-            print()
-
-        return
+    def execute(self, command, quiet=False):
+        return execute_remote_command(self.ip, command,
+                                      quiet=quiet, username=self.username)
 
     def download(self, src, dst):
         self.sftp.get(src, dst)
         return
 
+    def stream(self, command, bufsize=STREAM_BUFSIZE):
+        """Run COMMAND and return its channel and a binary file object
+        reading its output as it comes.
+
+        """
+        channel = self.client.get_transport().open_session()
+        channel.exec_command(command)
+
+        return channel, channel.makefile('rb', bufsize)
+
     def close(self):
-        self.client.close()
+        # only close our SFTP channel, the connection goes back to the pool
+        self.sftp.close()
+        POOL.release(self.ip, self.username)
 
 
 class BufferedRemoteCommand():
-    def __init__(self, ip, command, username=REMOTE_USER):
+    """Run a remote command and read its output line by line, as it comes,
+    either by iterating over it or with multitail() for several commands
+    at once.
+
+    """
+    def __init__(self, ip, command, username=REMOTE_USER, name=None):
         self.ip = ip
         self.command = command
         self.username = username
+        self.name = name or ip
 
-        self.client = SSHClient()
-        self.client.set_missing_host_key_policy(IgnoreHostKeyPolicy)
+        self.client = None
+        self.channel = None
+        self.closed = False
+        self.rc = None
 
+        # the current line, until we read its end
+        self.buffer = b''
         self.lines = []
-        self.current_line = None
         return
 
     def open(self):
-        self.client.connect(self.ip, username=self.username)
-
+        self.client = POOL.acquire(self.ip, self.username)
         self.transport = self.client.get_transport()
-        self.transport.set_keepalive(30)
 
         self.channel = self.transport.open_session()
         self.channel.set_combine_stderr(True)
@@ -220,95 +316,76 @@ class BufferedRemoteCommand():
 
         return
 
-    def read(self, nbytes=256):
-        if self.channel.recv_ready():
-            b = self.channel.recv(nbytes)
-
-            if len(b) == 0:
-                self.closed = True
-                return 0, None
-            else:
-                s = b.decode('utf-8')
-                return len(b), s
-
-        # try again later
-        return -1, None
+    def fileno(self):
+        # paramiko channels can be used with select() and selectors
+        return self.channel.fileno()
 
     def readlines(self):
-        nbytes, out = self.read()
+        """Read a chunk of output and return the complete lines in there.
+        Blocks until some output is available, unless the channel is ready
+        for reading already.
 
-        if nbytes == -1:
-            # no luck this time, come later
-            while nbytes == -1:
-                time.sleep(1)
-                nbytes, out = self.read()
+        """
+        data = self.channel.recv(READ_SIZE)
 
-        if nbytes == 0:
-            # we're closed
-            lines = []
+        if not data:
+            self.closed = True
+            lines = [self.buffer] if self.buffer else []
+            self.buffer = b''
 
         else:
-            lines = out.splitlines()
-
-            if self.current_line:
-                lines[0] = self.current_line + lines[0]
-                self.current_line = None
+            lines = (self.buffer + data).split(b'\n')
+            self.buffer = lines.pop()
 
-            if out[-1] != '\n':
-                self.current_line = lines[-1]
-                lines = lines[:-1]
+            # bound the memory used for a single line
+            if len(self.buffer) > MAX_LINE:
+                lines.append(self.buffer)
+                self.buffer = b''
 
-            if not lines:
-                # we got a chunk of a line, not a whole one, keep buffering
-                return self.readlines()
-
-        return nbytes, lines
+        return [line.decode('utf-8', errors='replace') for line in lines]
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.channel.exit_status_ready():
-            self.rc = self.channel.recv_exit_status()
-            raise StopIteration
-
-        if not self.lines:
-            # fetch another round on the remote connection
-            nbytes, self.lines = self.readlines()
-
-            if nbytes == 0:
-                # we're done
+        while not self.lines:
+            if self.closed:
+                self.rc = self.channel.recv_exit_status()
                 raise StopIteration
 
-        line = self.lines.pop(0)
-        return line
+            self.lines = self.readlines()
+
+        return self.lines.pop(0)
 
     def close(self):
-        return self.client.close()
+        self.channel.close()
+        POOL.release(self.ip, self.username)
+
+
+def multitail(remotes, pattern=None):
+    """Yield (name, line) for the output lines of all the REMOTES, opened
+    BufferedRemoteCommand objects, as soon as any of them has a complete
+    line. Only the lines matching the regular expression PATTERN are
+    returned, when given. The remote commands are closed when done.
+
+    """
+    regexp = re.compile(pattern) if pattern else None
 
+    with selectors.DefaultSelector() as selector:
+        for remote in remotes:
+            selector.register(remote, selectors.EVENT_READ)
 
-def roundrobin(iterables, startup=10):
-    "roundrobin('ABC', 'D', 'EF') --> A D E B F C"
-    # Recipe credited to George Sakkis
-    lines = {}
-    for it in iterables:
-        lines[it] = 0
+        while selector.get_map():
+            for key, _ in selector.select():
+                remote = key.fileobj
 
-    for it in iterables:
-        while lines[it] < startup:
-            yield it.__next__()
-            lines[it] += 1
+                for line in remote.readlines():
+                    if regexp is None or regexp.search(line):
+                        yield remote.name, line
 
-    num_active = len(iterables)
-    nexts = cycle(iter(it).__next__ for it in iterables)
-    while num_active:
-        try:
-            for next in nexts:
-                yield next()
-        except StopIteration:
-            # Remove the iterator we just exhausted from the cycle.
-            num_active -= 1
-            nexts = cycle(islice(nexts, num_active))
+                if remote.closed:
+                    selector.unregister(remote)
+                    remote.close()
 
 
 def maybe_install_resdb(resdb):
@@ -320,15 +397,32 @@ select count(*)
  where relname in ('run',
                    'job',
                    'query',
+                   'backlog',
+                   'saturation',
+                   'tpch_test',
+                   'refresh',
+                   'histogram',
+                   'sync',
+                   'load_step',
+                   'load_copy',
                    'results',
                    'qpm',
-                   'query_timings')
+                   'query_timings',
+                   'power',
+                   'throughput',
+                   'qphh',
+                   'refresh_timings',
+                   'qpm_under_refresh',
+                   'plan_timings',
+                   'histogram_timings',
+                   'ingest_rate',
+                   'table_throughput')
 """
     curs = conn.cursor()
     curs.execute(sql)
     count, = curs.fetchone()
 
-    if count != 6:
+    if count != 23:
         log = logging.getLogger('TPCH')
         log.info("Installing the tracking schema in %s", resdb)
         run_command('tracking.sql', RESDB_PSQL % resdb)
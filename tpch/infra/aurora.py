@@ -9,6 +9,8 @@ from collections import namedtuple
 
 from . import rds
 from . import utils
+from . import ready
+from . import describe
 
 
 class Cluster():
@@ -43,6 +45,8 @@ class Cluster():
             MasterUsername = self.MasterUsername,
             MasterUserPassword = self.MasterUserPassword
         )
+        describe.CACHE.invalidate('db_clusters')
+
         with open(self.filename, 'w') as outfile:
             json.dump(out, outfile, default=utils.json_serial, indent=6)
 
@@ -60,29 +64,29 @@ class Cluster():
         return self.data
 
     def describe(self):
+        "Return the description of our cluster, from the describe cache."
         if self.id:
-            return self.conn.describe_db_clusters(
-                DBClusterIdentifier = self.id)
+            return describe.CACHE.db_cluster(self.conn, self.id)
 
     def status(self):
         if self.id:
-            try:
-                self.data = self.conn.describe_db_clusters(
-                    DBClusterIdentifier = self.id)
-                return self.data['DBClusters'][0]['Status']
-            except self.conn.exceptions.DBClusterNotFoundFault:
+            desc = self.describe()
+            if desc:
+                return desc['Status']
+            else:
                 return 'Not Found'
 
     def endpoint(self):
         if self.id:
             desc = self.describe()
-            return desc['DBClusters'][0]['Endpoint']
+            return desc['Endpoint']
 
     def delete(self):
         res = self.conn.delete_db_cluster(
             DBClusterIdentifier = self.id,
             SkipFinalSnapshot = True
         )
+        describe.CACHE.invalidate('db_clusters')
         if self.filename and os.path.exists(self.filename):
             os.remove(self.filename)
 
@@ -119,6 +123,8 @@ class Aurora(rds.RDS):
             Engine = 'aurora-postgresql',
             DBInstanceClass = self.conf.iclass
         )
+        describe.CACHE.invalidate('db_instances')
+
         with open(self.filename, 'w') as outfile:
             json.dump(out, outfile, default=utils.json_serial, indent=6)
 
@@ -138,11 +144,23 @@ class Aurora(rds.RDS):
                 self.conf.dbname
             )
 
+    def wait_for_dsn(self):
+        ready.aws_waiter(self.conn, 'db_instance_available',
+                         DBInstanceIdentifier = self.id)
+
+        # the cluster is available a little after its instance
+        def dsn():
+            describe.CACHE.invalidate('db_clusters')
+            return self.dsn()
+
+        return ready.until(dsn)
+
     def delete(self):
         instance_ret = self.conn.delete_db_instance(
             DBInstanceIdentifier = self.id,
             SkipFinalSnapshot = True
         )
+        describe.CACHE.invalidate('db_instances')
         if self.filename and os.path.exists(self.filename):
             os.remove(self.filename)
 
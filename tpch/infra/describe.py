@@ -0,0 +1,87 @@
+import time
+import threading
+
+# A single describe_* call returns the whole fleet of a region, and we keep
+# the result for TTL seconds: listing a run then costs one API call per kind
+# of resource, rather than several calls per resource. The cache is
+# invalidated after we change a resource (run, terminate, create, delete),
+# and after a boto3 waiter returned.
+TTL = 10
+
+
+class DescribeCache():
+    def __init__(self, ttl=TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # (region, kind) -> (timestamp, dict of resource id to description)
+        self.entries = {}
+
+        # (region, kind) -> lock, held while describing
+        self.locks = {}
+
+    def get(self, conn, kind, fetch):
+        key = (conn.meta.region_name, kind)
+
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+
+        # concurrent threads wait for the same describe call
+        with lock:
+            entry = self.entries.get(key)
+
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                entry = (time.monotonic(), fetch(conn))
+                self.entries[key] = entry
+
+            return entry[1]
+
+    def invalidate(self, kind=None):
+        "Forget about the resources of KIND, or all of them."
+        for key in list(self.entries):
+            if kind is None or key[1] == kind:
+                self.entries.pop(key, None)
+
+    def instance(self, conn, iid):
+        "Return the description of the EC2 instance IID, or None."
+        return self.get(conn, 'instances', fetch_instances).get(iid)
+
+    def db_instance(self, conn, dbid):
+        "Return the description of the RDS instance DBID, or None."
+        return self.get(conn, 'db_instances', fetch_db_instances).get(dbid)
+
+    def db_cluster(self, conn, cid):
+        "Return the description of the RDS cluster CID, or None."
+        return self.get(conn, 'db_clusters', fetch_db_clusters).get(cid)
+
+
+def fetch_instances(conn):
+    instances = {}
+    paginator = conn.get_paginator('describe_instances')
+
+    for page in paginator.paginate():
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                instances[instance['InstanceId']] = instance
+
+    return instances
+
+
+def fetch_db_instances(conn):
+    paginator = conn.get_paginator('describe_db_instances')
+
+    return {db['DBInstanceIdentifier']: db
+            for page in paginator.paginate()
+            for db in page['DBInstances']}
+
+
+def fetch_db_clusters(conn):
+    paginator = conn.get_paginator('describe_db_clusters')
+
+    return {cluster['DBClusterIdentifier']: cluster
+            for page in paginator.paginate()
+            for cluster in page['DBClusters']}
+
+
+# shared by all the Instance, RDS and Aurora objects
+CACHE = DescribeCache()
@@ -9,6 +9,8 @@ import configparser
 from collections import namedtuple
 
 from . import utils
+from . import ready
+from . import describe
 
 
 class Instance():
@@ -54,6 +56,8 @@ class Instance():
             MinCount = 1,
             MaxCount = 1
         )
+        describe.CACHE.invalidate('instances')
+
         with open(self.filename, 'w') as outfile:
             json.dump(out, outfile, default=utils.json_serial, indent=6)
 
@@ -78,50 +82,56 @@ class Instance():
             return self.data["Instances"][0]["InstanceType"]
         return None
 
-    def status(self):
+    def describe(self):
+        "Return the description of our instance, from the describe cache."
         if hasattr(self, "id"):
             try:
-                self._status = self.conn.describe_instance_status(
-                    InstanceIds = [self.id])
+                return describe.CACHE.instance(self.conn, self.id)
             except botocore.exceptions.ClientError:
-                return "unknown"
-        else:
-            return "unknown"
+                return None
 
-        if self._status["InstanceStatuses"]:
-            return self._status["InstanceStatuses"][0]["InstanceState"]["Name"]
+    def status(self):
+        desc = self.describe()
+
+        if desc:
+            return desc["State"]["Name"]
         else:
-            return "Unknown"
+            return "unknown"
 
     def public_ip(self):
-        filter = {'Name': 'attachment.instance-id', 'Values': [self.id]}
-        nic = self.conn.describe_network_interfaces(Filters = [filter])
-        self.interfaces = nic
-        if nic["NetworkInterfaces"]:
-            return nic["NetworkInterfaces"][0]["Association"]["PublicIp"]
+        desc = self.describe()
+
+        if desc:
+            return desc.get("PublicIpAddress")
 
     def wait_for_public_ip(self):
-        status = self.status()
+        ready.aws_waiter(self.conn, 'instance_running',
+                         InstanceIds = [self.id])
+
+        # the public IP is associated shortly after the instance runs
+        def public_ip():
+            describe.CACHE.invalidate('instances')
+            return self.public_ip()
 
-        while status != 'running':
-            time.sleep(1)
-            status = self.status()
+        ip = ready.until(public_ip)
 
         # ok it's running, what about actually listening to ssh connections?
-        ip = self.public_ip()
         utils.wait_for_service(ip, port=22)
 
         return ip
 
     def start(self):
         res = self.conn.start_instances(InstanceIds = [self.id])
+        describe.CACHE.invalidate('instances')
         return res
 
     def stop(self):
         res = self.conn.stop_instances(InstanceIds = [self.id])
+        describe.CACHE.invalidate('instances')
         return res['StoppingInstances'][0]['CurrentState']['Name']
 
     def terminate(self):
+        describe.CACHE.invalidate('instances')
         try:
             res = self.conn.terminate_instances(InstanceIds = [self.id])
             if self.filename and os.path.exists(self.filename):
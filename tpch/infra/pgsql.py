@@ -10,6 +10,7 @@ from collections import namedtuple
 
 from . import utils
 from . import instance
+from . import describe
 from ..control import utils as cntl
 
 MAKEFILE     = 'Makefile.loader'
@@ -72,6 +73,8 @@ class PgSQL(instance.Instance):
             MinCount = 1,
             MaxCount = 1
         )
+        describe.CACHE.invalidate('instances')
+
         with open(self.filename, 'w') as outfile:
             json.dump(out, outfile, default=utils.json_serial, indent=6)
 
@@ -8,6 +8,8 @@ import configparser
 from collections import namedtuple
 
 from . import utils
+from . import ready
+from . import describe
 
 
 class RDS():
@@ -39,6 +41,8 @@ class RDS():
             StorageType = self.conf.stype,
             Iops = self.conf.iops
         )
+        describe.CACHE.invalidate('db_instances')
+
         with open(self.filename, 'w') as outfile:
             json.dump(out, outfile, default=utils.json_serial, indent=6)
 
@@ -56,16 +60,16 @@ class RDS():
         return self.data
 
     def describe(self):
+        "Return the description of our instance, from the describe cache."
         if self.id:
-            return self.conn.describe_db_instances(
-                DBInstanceIdentifier = self.id)
+            return describe.CACHE.db_instance(self.conn, self.id)
 
     def status(self):
         if self.id:
-            try:
-                desc = self.describe()
-                return desc['DBInstances'][0]['DBInstanceStatus']
-            except self.conn.exceptions.DBInstanceNotFoundFault:
+            desc = self.describe()
+            if desc:
+                return desc['DBInstanceStatus']
+            else:
                 return 'Not Found'
 
     def is_ready(self):
@@ -79,34 +83,34 @@ class RDS():
 
     def dsn(self):
         desc = self.describe()
-        status = desc['DBInstances'][0]['DBInstanceStatus']
+        status = self.status()
 
         if status == 'available':
             return "postgresql://%s:%s@%s:%s/%s" % (
-                desc['DBInstances'][0]['MasterUsername'],
+                desc['MasterUsername'],
                 'tcph-dummy-password',
-                desc['DBInstances'][0]['Endpoint']['Address'],
-                desc['DBInstances'][0]['Endpoint']['Port'],
-                desc['DBInstances'][0]['DBName']
+                desc['Endpoint']['Address'],
+                desc['Endpoint']['Port'],
+                desc['DBName']
             )
         else:
             return 'No DSN yet: %s' % status
 
     def wait_for_dsn(self):
-        dsn = self.dsn()
-
-        while dsn.startswith(u'No DSN yet:'):
-            time.sleep(30)      # creating an RDS instance takes a long time!
-            dsn = self.dsn()
+        # creating an RDS instance takes a long time!
+        ready.aws_waiter(self.conn, 'db_instance_available',
+                         DBInstanceIdentifier = self.id)
 
-        return dsn
+        return self.dsn()
 
     def start(self):
         res = self.conn.start_db_instance(DBInstanceIdentifier = self.id)
+        describe.CACHE.invalidate('db_instances')
         return res['DBInstance']['DBInstanceStatus']
 
     def stop(self):
         res = self.conn.stop_db_instance(DBInstanceIdentifier = self.id)
+        describe.CACHE.invalidate('db_instances')
         return res['DBInstance']['DBInstanceStatus']
 
     def delete(self):
@@ -114,6 +118,7 @@ class RDS():
             DBInstanceIdentifier = self.id,
             SkipFinalSnapshot = True
         )
+        describe.CACHE.invalidate('db_instances')
         if self.filename and os.path.exists(self.filename):
             os.remove(self.filename)
         return res['DBInstance']['DBInstanceStatus']
@@ -0,0 +1,96 @@
+import time
+import random
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import describe
+
+# Waiting for AWS resources and services to be ready. The AWS state changes
+# are left to the boto3 waiters, and our own checks (is the ssh port open
+# yet?) are retried with an exponential backoff and full jitter: the first
+# retries are quick, and we don't hammer the APIs when it takes a while.
+BACKOFF_BASE = 0.5
+BACKOFF_CAP  = 30
+TIMEOUT      = 3600
+
+# boto3 waiters poll the AWS API every WAITER_DELAY seconds
+WAITER_DELAY = 15
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    "Return how long to sleep before the retry number ATTEMPT."
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def until(check, timeout=TIMEOUT, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Call CHECK until it returns a true value, and return that value.
+    Raise TimeoutError when it's still not there after TIMEOUT seconds.
+
+    """
+    start = time.monotonic()
+    attempt = 0
+
+    while True:
+        value = check()
+
+        if value:
+            return value
+
+        delay = backoff(attempt, base, cap)
+
+        if time.monotonic() - start + delay > timeout:
+            raise TimeoutError("%s not ready after %ds"
+                               % (check.__name__, timeout))
+
+        time.sleep(delay)
+        attempt += 1
+
+
+def aws_waiter(conn, name, timeout=TIMEOUT, **kwargs):
+    """Use the boto3 waiter NAME of the client CONN, e.g. instance_running,
+    passing it KWARGS to describe the resource.
+
+    """
+    config = {'Delay': WAITER_DELAY,
+              'MaxAttempts': max(1, int(timeout / WAITER_DELAY))}
+
+    conn.get_waiter(name).wait(WaiterConfig=config, **kwargs)
+
+    # the resource changed while we were waiting for it
+    describe.CACHE.invalidate()
+
+
+def wait_all(resources, max_workers=16):
+    """Wait for all the RESOURCES concurrently, a list of (name, function)
+    where each function blocks until its resource is ready, and return the
+    timeline: a list of (name, seconds, error) in the order the resources
+    were ready. A failure to wait for a resource is logged and doesn't stop
+    waiting for the others.
+
+    """
+    log = logging.getLogger('TPCH')
+    timeline = []
+
+    if not resources:
+        return timeline
+
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(min(max_workers, len(resources))) as executor:
+        futures = {executor.submit(fun): name for name, fun in resources}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            secs = time.monotonic() - start
+
+            try:
+                future.result()
+                log.info('%s ready after %.1fs', name, secs)
+                timeline.append((name, secs, None))
+
+            except Exception as e:
+                log.error('%s not ready after %.1fs: %s', name, secs, e)
+                timeline.append((name, secs, e))
+
+    return timeline
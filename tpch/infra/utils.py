@@ -1,6 +1,8 @@
 import socket
 from datetime import date, datetime
 
+from . import ready
+
 
 def json_serial(obj):
     """JSON serializer for objects not serializable by default json code"""
@@ -34,9 +36,8 @@ def ping(host, port = 22, timeout = 1):
 
 def wait_for_service(host, port = 22, timeout = 1):
     "Ping given PORT on HOST until we could actually connect there."
-    pong = ping(host, port, timeout)
-
-    while pong is False:
-        pong = ping(host, port, timeout)
+    def service():
+        return ping(host, port, timeout)
 
-    return True
+    # services come up quickly once the instance is running
+    return ready.until(service, cap = 5)
@@ -0,0 +1,96 @@
+import time
+import logging
+import psycopg2
+from multiprocessing import util
+
+# Each worker process of a TaskPool holds a single long-lived connection to
+# the system under test, opened by the pool initializer and then borrowed
+# by every stream the worker runs. Connecting (and TLS) is expensive on
+# RDS and Aurora, and we don't want to measure that in our QPM.
+#
+# A connection that has been idle for more than IDLE_CHECK seconds is
+# checked with a round-trip before being handed over again.
+IDLE_CHECK = 30
+
+_conn = None
+_dsn = None
+_last_used = 0
+
+
+def init_worker(dsn):
+    "TaskPool initializer: open the connection for this worker process."
+    try:
+        connect(dsn)
+    except psycopg2.Error as e:
+        # an exception here would break the whole pool, rather connect
+        # again later from get_connection
+        logging.getLogger('TPCH').warning(
+            'failed to connect to the system under test: %s', e)
+
+    # close the connection cleanly when the worker process exits
+    util.Finalize(None, close, exitpriority=10)
+
+
+def connect(dsn):
+    "Open a new connection to DSN and keep it around."
+    global _conn, _dsn, _last_used
+
+    close()
+
+    _conn = psycopg2.connect(dsn)
+    _conn.autocommit = True
+
+    _dsn = dsn
+    _last_used = time.monotonic()
+
+    return _conn
+
+
+def close():
+    "Close the worker connection, if any."
+    global _conn
+
+    if _conn is not None and not _conn.closed:
+        _conn.close()
+
+    _conn = None
+
+
+def is_healthy(conn):
+    "Check that CONN is still usable with a round-trip to the server."
+    if conn.closed:
+        return False
+
+    try:
+        curs = conn.cursor()
+        curs.execute('select 1')
+        curs.fetchall()
+        curs.close()
+        return True
+
+    except psycopg2.Error:
+        return False
+
+
+def get_connection(dsn):
+    """Return the worker connection to DSN, connecting again when the
+    current connection is closed or doesn't pass the health check.
+
+    """
+    if _conn is None or _conn.closed or _dsn != dsn:
+        return connect(dsn)
+
+    if time.monotonic() - _last_used > IDLE_CHECK and not is_healthy(_conn):
+        logging.getLogger('TPCH').warning(
+            'connection to the system under test lost, reconnecting')
+        return connect(dsn)
+
+    return _conn
+
+
+def release(conn):
+    "Give back the worker connection CONN once done with it."
+    global _last_used
+
+    _last_used = time.monotonic()
+    return
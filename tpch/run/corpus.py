@@ -0,0 +1,94 @@
+import os
+import os.path
+import gzip
+import json
+import zlib
+
+from . import qgen
+
+# A corpus is a set of VARIANTS query streams rendered with qgen once and
+# for all, from a given seed and for a given scale factor, and kept in a
+# gzip compressed JSON file. Streams then draw their queries from the
+# corpus rather than running qgen each time, and every system tested with
+# the same seed runs the very same sequence of query parameters.
+CORPUS_DIR = os.path.join(os.path.dirname(__file__),
+                          '..',
+                          '..',
+                          'corpus')
+
+CORPUS_FILE = 'sf%s-seed%d.json.gz'
+
+# the corpus has every TPC-H query, so that any stream can use it
+QUERIES = ' '.join(str(q) for q in range(1, 23))
+
+
+def run_seed(name):
+    "Return a seed derived from the run NAME, shared by all its systems."
+    return zlib.crc32(name.encode('utf-8')) % (2**31 - 1) + 1
+
+
+class Corpus():
+    def __init__(self, seed, sf, variants, queries):
+        self.seed = seed
+        self.sf = sf
+        self.variants = variants
+
+        # a dict of query name to a list of VARIANTS sql texts
+        self.queries = queries
+
+    @classmethod
+    def filename(cls, seed, sf):
+        return os.path.join(CORPUS_DIR, CORPUS_FILE % (sf, seed))
+
+    @classmethod
+    def build(cls, seed, sf, variants):
+        "Run qgen VARIANTS times, with seeds SEED, SEED+1, etc."
+        queries = {}
+
+        for k in range(variants):
+            for name, sql in qgen.render(QUERIES, rndm=seed + k, sf=sf):
+                queries.setdefault(name, []).append(sql)
+
+        return cls(seed, sf, variants, queries)
+
+    @classmethod
+    def load(cls, seed, sf, variants):
+        """Load the corpus for SEED and SF from disk, or build it when we
+        don't have one with at least VARIANTS variants yet.
+
+        """
+        filename = cls.filename(seed, sf)
+
+        if os.path.exists(filename):
+            with gzip.open(filename, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+
+            if data['variants'] >= variants:
+                return cls(seed, sf, data['variants'], data['queries'])
+
+        corpus = cls.build(seed, sf, variants)
+        corpus.save()
+        return corpus
+
+    def save(self):
+        filename = self.filename(self.seed, self.sf)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        data = {'seed': self.seed,
+                'sf': self.sf,
+                'variants': self.variants,
+                'queries': self.queries}
+
+        # parallel jobs might build the same corpus, rename is atomic
+        tmp = '%s.%d' % (filename, os.getpid())
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, filename)
+
+    def stream(self, queries, n):
+        """Return the stream number N of QUERIES, a space separated list of
+        query numbers, as a list of (name, sql) tuples.
+
+        """
+        return [(name, self.queries[name][n % self.variants])
+                for name in queries.split()]
@@ -0,0 +1,97 @@
+import time
+
+# An HDR-style latency histogram: timings are recorded in microseconds, in
+# buckets that are 1/128th as wide as their lowest value, so that any
+# percentile computed from the histogram is known within 1% whatever the
+# range of the timings. Histograms with the same buckets are mergeable,
+# just add the counts of the same buckets together.
+#
+# Values below 2**SIGNIFICANT_BITS are kept exactly.
+SIGNIFICANT_BITS = 8
+
+# stream jobs flush a snapshot of their histograms every SNAPSHOT seconds
+SNAPSHOT = 10
+
+
+def bucket(value):
+    "Return the lowest value of the bucket where VALUE is counted."
+    shift = max(0, value.bit_length() - SIGNIFICANT_BITS)
+    return (value >> shift) << shift
+
+
+class Histogram():
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, us):
+        "Record a timing of US microseconds."
+        us = max(0, int(us))
+        key = bucket(us)
+
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += us
+
+        if self.min is None or us < self.min:
+            self.min = us
+
+        if self.max is None or us > self.max:
+            self.max = us
+
+    def buckets(self):
+        "Return the list of buckets and the list of their counts."
+        keys = sorted(self.counts)
+        return keys, [self.counts[k] for k in keys]
+
+    def percentile(self, pct):
+        """Return the PCT percentile in microseconds, or None when empty: the
+        lowest bucket with at least PCT percent of the timings at or below
+        it, as in the histogram_timings view.
+
+        """
+        below = 0
+
+        for key, count in zip(*self.buckets()):
+            below += count
+
+            if below >= pct / 100.0 * self.count:
+                return key
+
+        return None
+
+
+class Recorder():
+    """Keep a Histogram per query name, and hand them over as a snapshot
+    every SNAPSHOT seconds, starting again with empty histograms.
+
+    """
+    def __init__(self, interval=SNAPSHOT):
+        self.interval = interval
+        self.histograms = {}
+        self.last_snapshot = time.monotonic()
+
+    def record(self, name, us):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+
+        self.histograms[name].record(us)
+
+    def snapshot(self, force=False):
+        """Return a dict of query name to Histogram when it's time for a new
+        snapshot, or when FORCE is True, and None otherwise.
+
+        """
+        now = time.monotonic()
+
+        if not force and now - self.last_snapshot < self.interval:
+            return None
+
+        snapshot = self.histograms
+        self.histograms = {}
+        self.last_snapshot = now
+
+        return snapshot or None
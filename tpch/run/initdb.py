@@ -31,9 +31,15 @@ class InitDB(Schema):
 
         start = time.monotonic()
 
-        for schema, name in [(self.schema.drop, "drop tables"),
-                             (self.schema.tables, "create tables")]:
-            self.install_schema(name, schema)
+        # resuming an initdb keeps the steps that have been loaded already
+        resume, _, _ = self.track.load_progress('initdb')
+
+        if resume:
+            self.log("resuming the initial load, keeping the tables")
+        else:
+            for schema, name in [(self.schema.drop, "drop tables"),
+                                 (self.schema.tables, "create tables")]:
+                self.install_schema(name, schema)
 
         # don't track installing the cardinalities view...
         self.install_schema("cardinalities", CARDINALITIES, tracking=False)
@@ -42,8 +48,16 @@ class InitDB(Schema):
         # It loads the data and does the VACUUM ANALYZE on each table
         self.load.run(system, 'initdb')
 
+        # the constraints and indexes can't be created twice
+        installed = self.track.checkpoints('initdb')
+
         for sqlfile in self.schema.constraints:
+            if sqlfile in installed:
+                self.log("skipping %s, installed before", sqlfile)
+                continue
+
             self.install_schema(sqlfile, sqlfile)
+            self.track.register_checkpoint('initdb', sqlfile)
 
         end = time.monotonic()
         secs = end - start
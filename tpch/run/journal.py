@@ -0,0 +1,69 @@
+import os
+import os.path
+import json
+import fcntl
+from contextlib import contextmanager
+
+# Tracking writes every event of a run to a local append-only journal
+# before writing it to the results database, one JSON object per line.
+# When the results database is not available the benchmark goes on, and
+# the journal is replayed later on with tpch.py sync.
+JOURNAL_DIR = os.path.join(os.path.dirname(__file__),
+                           '..',
+                           '..',
+                           'journal')
+
+JOURNAL_FILE = '%s.jsonl'
+
+
+def filename(name):
+    "Return the journal filename of the run NAME."
+    return os.path.normpath(os.path.join(JOURNAL_DIR, JOURNAL_FILE % name))
+
+
+class Journal():
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = None
+
+    def open(self):
+        # parallel sub-schedules append to the same journal from their own
+        # process, a single write() in O_APPEND mode keeps lines whole
+        if self.fd is None:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            self.fd = os.open(self.filename,
+                              os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def append(self, event):
+        "Append EVENT, a dict, to the journal."
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        os.write(self.open(), line.encode('utf-8'))
+
+    def sync(self):
+        "Make sure the journal is on disk."
+        if self.fd is not None:
+            os.fsync(self.fd)
+
+    @contextmanager
+    def locked(self):
+        "Hold an exclusive lock on the journal, across processes."
+        fd = self.open()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def events(self):
+        "Read the journal and yield its events in order."
+        with open(self.filename, encoding='utf-8') as f:
+            for line in f:
+                # the last line might be incomplete after a crash
+                if line.endswith('\n'):
+                    yield json.loads(line)
@@ -1,10 +1,14 @@
+import re
 import time
+import random
 import logging
 import os.path
+import psycopg2
 from datetime import datetime
 
 from . import utils
 from .task_dist import DistributedTasks
+from .pressure import Controller
 from .helpers import Schema
 
 MAKEFILE = os.path.join(os.path.dirname(__file__),
@@ -12,36 +16,301 @@ MAKEFILE = os.path.join(os.path.dirname(__file__),
                         '..',
                         'Makefile.loader')
 
-LOAD     = 'make -f %s DSN=%s SF=%s C=%s S=%s load'
+LOAD     = 'make -f %s DSN=%s SF=%s C=%s S=%s T=%s FORMAT=%s load'
 VACUUM   = 'make -f %s DSN=%s vacuum'
 
+# a failed step is cleaned-up and loaded again, RETRIES times at most, with
+# an exponential backoff and jitter in between
+RETRIES       = 3
+BACKOFF_BASE  = 10
+BACKOFF_CAP   = 300
 
-def load(step, dsn, scale_factor, children):
-    # the LOAD phase doesn't bring any particulary useful information on the
-    # table, so just forget about any output here, really.
-    command = LOAD % (MAKEFILE, dsn, scale_factor, children, step)
-    out, err = utils.run_command(command)
+# the dbgen -T option to generate only the given table
+DBGEN_TABLES = {'lineitem': 'L',
+                'orders': 'O',
+                'partsupp': 'S',
+                'part': 'P',
+                'customer': 'c',
+                'supplier': 's',
+                'nation': 'n',
+                'region': 'r'}
+
+# roughly how many MB of data each table has at Scale Factor 1, used to
+# load the biggest units first so that no big table is left to load alone
+# at the end of a job
+SIZES = {'lineitem': 725,
+         'orders': 164,
+         'partsupp': 113,
+         'part': 23,
+         'customer': 23,
+         'supplier': 1.4,
+         'nation': 0.002,
+         'region': 0.0004}
+
+# dbgen rows per Scale Factor, see tdefs in tpch-pg/src/driver.c: a step of
+# a load with C children has the rows from (S-1) * N/C + 1 to S * N/C, the
+# last step also has the N % C remaining rows
+ROWS = {'part': 200000,
+        'supplier': 10000,
+        'customer': 150000,
+        'orders': 1500000}
+
+# the dbgen rows and the key of each table, nation and region are loaded
+# with the first step only
+KEYS = {'part': ('part', 'p_partkey'),
+        'partsupp': ('part', 'ps_partkey'),
+        'supplier': ('supplier', 's_suppkey'),
+        'customer': ('customer', 'c_custkey'),
+        'orders': ('orders', 'o_orderkey'),
+        'lineitem': ('orders', 'l_orderkey')}
+
+# rows per dbgen row: 4 suppliers per part, and 4 lineitems per order on
+# average, and the rows of the nation and region tables
+FANOUT = {'partsupp': 4, 'lineitem': 4}
+CODES  = {'nation': 25, 'region': 5}
+
+
+# dbgen prints a line for each COPY stream it's done with, see load_stub.c
+COPY_STATS = re.compile(r'^copy (\w+) (\d+) (\d+) ([0-9.]+)$')
+
+
+def sparse(row):
+    "Return the orders key of the ROW number, see mk_sparse in build.c."
+    return ((row >> 3) << 5) | (row & 7)
+
+
+def step_rows(table, scale_factor, children, step):
+    "Return the first and last dbgen rows of TABLE generated by STEP."
+    rows = int(ROWS[table] * scale_factor)
+    rowcnt = rows // children
+
+    first = rowcnt * (step - 1) + 1
+    last = rowcnt * step
+
+    if step == children:
+        last += rows % children
+
+    return first, last
+
+
+def step_range(table, scale_factor, children, step):
+    "Return the first and last keys of TABLE loaded by STEP."
+    first, last = step_rows(table, scale_factor, children, step)
+
+    if table == 'orders':
+        return sparse(first), sparse(last)
+
+    return first, last
+
+
+def unit_rows(unit, scale_factor, children):
+    "Return about how many rows the (relname, step) UNIT loads."
+    relname, step = unit
+    relnames = [relname] if relname else list(DBGEN_TABLES)
+    rows = 0
+
+    for relname in relnames:
+        if relname in KEYS:
+            first, last = step_rows(KEYS[relname][0],
+                                    scale_factor, children, step)
+            rows += (last - first + 1) * FANOUT.get(relname, 1)
+
+        elif step == 1:
+            rows += CODES[relname]
+
+    return rows
+
+
+def units(steps, children, split='table'):
+    """Return the list of (relname, step) units to load for STEPS, biggest
+    first. When SPLIT is 'step', relname is None: dbgen loads all the tables
+    of the step in a single process.
+
+    """
+    if split == 'step':
+        return [(None, step) for step in steps]
+
+    units = [(relname, step)
+             for step in steps
+             for relname in DBGEN_TABLES
+             if relname in KEYS or step == 1 or children == 1]
+
+    return sorted(units, key=lambda unit: -SIZES[unit[0]])
+
+
+def cleanup(unit, dsn, scale_factor, children):
+    """Delete the rows of the (relname, step) UNIT from the database, so that
+    loading it again doesn't duplicate the rows that made it before a
+    failure.
+
+    """
+    relname, step = unit
+    relnames = [relname] if relname else list(DBGEN_TABLES)
+
+    conn = psycopg2.connect(dsn)
+
+    with conn:
+        with conn.cursor() as curs:
+            for relname in relnames:
+                if relname in KEYS:
+                    table, key = KEYS[relname]
+                    first, last = step_range(table,
+                                             scale_factor, children, step)
+
+                    curs.execute('delete from %s where %s between %%s and %%s'
+                                 % (relname, key), (first, last))
+
+                elif step == 1:
+                    curs.execute('delete from %s' % relname)
+
+    conn.close()
+
+
+def load(unit, dsn, scale_factor, children, dirty=(), copy_format='text'):
+    """Load the (relname, step) UNIT of data, retrying with a cleanup when it
+    fails. When the unit is in DIRTY, a previous attempt at it started and
+    didn't finish, so begin with a cleanup. COPY_FORMAT is the format dbgen
+    sends the rows in, text or binary.
+
+    Return the number of attempts, the start time and duration of the unit,
+    and the list of (relname, rows, bytes, secs) of its COPY streams.
+
+    """
+    logger = logging.getLogger('TPCH')
+    relname, step = unit
+
+    if unit in dirty:
+        cleanup(unit, dsn, scale_factor, children)
+
+    start = datetime.now()
+    t0 = time.monotonic()
+
+    for attempt in range(1, RETRIES + 1):
+        # the LOAD phase doesn't bring any particulary useful information on
+        # the table, so just forget about any output here, really.
+        command = LOAD % (MAKEFILE, dsn, scale_factor, children, step,
+                          DBGEN_TABLES.get(relname, ''), copy_format)
+        out, err = utils.run_command(command)
+
+        if not err:
+            return attempt, start, time.monotonic() - t0, copy_stats(out)
 
-    if err:
-        logger = logging.getLogger('TPCH')
         logger.error(command)
         for line in out:
             logger.error(line)
         for line in err:
             logger.error(line)
 
-        raise RuntimeError("Failed to load step %s" % step)
+        cleanup(unit, dsn, scale_factor, children)
+
+        if attempt < RETRIES:
+            delay = random.uniform(0, min(BACKOFF_CAP,
+                                          BACKOFF_BASE * 2 ** attempt))
+            logger.warning('%s failed, trying again in %ds (%d/%d)',
+                           unit_name(unit), delay, attempt + 1, RETRIES)
+            time.sleep(delay)
+
+    raise RuntimeError("Failed to load %s" % unit_name(unit))
+
+
+def copy_stats(output):
+    "Return the list of (relname, rows, bytes, secs) found in dbgen OUTPUT."
+    stats = []
+
+    for line in output:
+        match = COPY_STATS.match(line)
 
-    return
+        if match:
+            relname, rows, size, secs = match.groups()
+            stats.append((relname.lower(), int(rows), int(size), float(secs)))
+
+    return stats
+
+
+def overlaps(unit, other):
+    "Return whether the (relname, step) UNIT and OTHER share some rows."
+    return unit[1] == other[1] \
+        and (unit[0] is None or other[0] is None or unit[0] == other[0])
+
+
+def unit_name(unit):
+    relname, step = unit
+
+    if relname:
+        return '%s step %d' % (relname, step)
+
+    return 'step %d' % step
 
 
 class DistributedLoad(DistributedTasks):
-    def report_progress(self, arg):
-        self.logger.info('%s: loaded step %d/%d for Scale Factor %d',
+    def __init__(self, cpu, controller=None):
+        super().__init__(cpu)
+
+        # adaptive loads start and stop workers as the controller says
+        self.controller = controller
+        self.concurrency = {}
+
+        if controller:
+            self.interval = 1
+
+    def limit(self):
+        if self.controller:
+            return self.controller.workers
+        return self.cpu
+
+    def tick(self):
+        if not self.controller:
+            return
+
+        change = self.controller.tick()
+
+        if change:
+            workers, reason = change
+            self.logger.info('%s: using %d load workers: %s',
+                             self.system, workers, reason)
+
+    def report_start(self, arg):
+        self.concurrency[arg] = self.limit()
+        self.track.register_load_start(self.job, arg)
+
+    def report_progress(self, arg, result):
+        attempts, start, secs, copies = result
+        relname, step = arg
+
+        for copy in copies:
+            self.track.register_load_copy(self.job, step, *copy)
+
+        # a dbgen without COPY stats only gives us an estimate
+        if copies:
+            rows = sum(copy[1] for copy in copies)
+            size = sum(copy[2] for copy in copies)
+        else:
+            rows = unit_rows(arg, self.scale_factor, self.children)
+            size = 0
+
+        self.logger.info('%s: loaded %s/%d for Scale Factor %d '
+                         '(%d workers, %.0f rows/s, %.1f MB/s)',
                          self.system,
-                         arg,
+                         unit_name(arg),
                          self.children,
-                         self.scale_factor)
+                         self.scale_factor,
+                         self.concurrency[arg],
+                         rows / secs,
+                         size / secs / 1024 / 1024)
+
+        if self.controller:
+            self.controller.observe(rows)
+
+        # the unit is done, never load it again
+        self.track.register_load_step(self.job, arg, attempts, start, secs,
+                                      self.concurrency[arg])
+
+    def report_failure(self, arg, error):
+        self.logger.error('%s: failed to load %s/%d: %s',
+                          self.system,
+                          unit_name(arg),
+                          self.children,
+                          error)
 
 
 class Load(Schema):
@@ -53,7 +322,12 @@ class Load(Schema):
         self.steps = self.conf.steps
         self.cpu = self.conf.cpu
 
-        self.dist = DistributedLoad(self.cpu)
+        # with an adaptive load, cpu is the maximum number of workers
+        controller = None
+        if self.conf.adaptive:
+            controller = Controller(self.dsn, self.cpu)
+
+        self.dist = DistributedLoad(self.cpu, controller)
         self.dist.scale_factor = self.conf.scale_factor
         self.dist.children = self.conf.children
         self.dist.track = self.track
@@ -64,20 +338,52 @@ class Load(Schema):
         self.system = system
         self.dist.system = system
 
-        self.log("loading %d steps of data using %d CPU: %s",
-                 len(self.steps), self.cpu, self.steps)
+        # skip the units done by a previous run of the same job, whole
+        # steps are done for all of their tables
+        _, done, started = self.track.load_progress(phase)
+        todo = [unit for unit in units(self.steps,
+                                       self.conf.children,
+                                       self.conf.split)
+                if unit not in done and (None, unit[1]) not in done]
+
+        # only the units that have been started before might have rows to
+        # clean-up, possibly with another split of the tables
+        dirty = set(unit for unit in todo
+                    if any(overlaps(unit, other)
+                           for other in started - done))
+
+        if done:
+            self.log("skipping %d units loaded before", len(done))
+
+        if dirty:
+            self.log("cleaning-up %d units interrupted before", len(dirty))
+
+        self.log("loading %d steps of data in %d units using %d CPU: %s",
+                 len(self.steps), len(todo), self.cpu, self.steps)
+
+        if self.dist.controller:
+            self.log("starting with %d workers, adapting to the server",
+                     self.dist.controller.workers)
 
         start = datetime.now()
+        self.dist.job = self.track.register_job(
+            phase, start=start, steps=self.steps)
+
+        try:
+            res, secs = self.dist.run(
+                load,
+                todo,
+                self.dsn,
+                self.conf.scale_factor,
+                self.conf.children,
+                dirty,
+                self.conf.format
+            )
+        finally:
+            if self.dist.controller:
+                self.dist.controller.close()
 
-        res, secs = self.dist.run(
-            load,
-            self.steps,
-            self.dsn,
-            self.conf.scale_factor,
-            self.conf.children
-        )
-        self.track.register_job(
-            phase, start=start, secs=secs, steps=self.steps)
+        self.track.register_job_time(self.dist.job, secs)
 
         self.log("vacuum analyze")
         for sqlfile in self.schema.vacuum:
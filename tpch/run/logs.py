@@ -1,5 +1,6 @@
 import sys
 import logging
+import logging.handlers
 from multiprocessing import Process, Queue
 
 
@@ -0,0 +1,180 @@
+import re
+import os.path
+from collections import namedtuple
+
+# In the prepared mode each query template is prepared once per connection,
+# and then every query qgen renders from that template is executed with
+# its parameters bound to the prepared statement. The parameters are found
+# by matching the rendered query against its template.
+TEMPLATES = os.path.join(os.path.dirname(__file__),
+                         '..',
+                         '..',
+                         'tpch-pg',
+                         'queries')
+
+PREPARE = 'prepare tpch_q%s as %s'
+
+# have the server report planning and execution timings separately, the
+# result set is computed but not sent to the client
+EXPLAIN = 'explain (analyze, timing off, summary, format json) ' \
+    'execute tpch_q%s(%s)'
+
+# query timings of the prepared mode, all of them as timedelta values
+Timing = namedtuple('Timing', 'duration plan execute')
+
+# a quoted literal, possibly a date or a number of days, or a parameter
+TOKEN = re.compile(r"(date\s+|interval\s+)?'([^']*)'(\s+day)?|:(\d+)")
+PARAM = re.compile(r':(\d+)')
+SPACES = re.compile(r'\s+')
+LIMIT = re.compile(r':n\s+(-?\d+)')
+
+_templates = {}
+
+
+class Template():
+    def __init__(self, name, text):
+        self.name = name
+        self.params = set()
+
+        statement, pattern = [], []
+        position = 0
+
+        for m in TOKEN.finditer(text):
+            between = text[position:m.start()]
+            statement.append(between)
+            pattern.append(self.pattern(between))
+            position = m.end()
+
+            prefix, literal, suffix, param = m.groups()
+
+            if param:
+                statement.append('$%s' % param)
+                pattern.append(self.group(param))
+
+            elif PARAM.search(literal):
+                statement.append(self.expression(prefix, literal, suffix))
+                pattern.append(self.pattern(m.group(0)))
+
+            else:
+                statement.append(m.group(0))
+                pattern.append(self.pattern(m.group(0)))
+
+        statement.append(text[position:])
+        pattern.append(self.pattern(text[position:]))
+
+        self.sql = PREPARE % (name, ''.join(statement))
+        self.regexp = re.compile(''.join(pattern))
+
+    def expression(self, prefix, literal, suffix):
+        "Return the SQL expression for a quoted LITERAL with parameters."
+        if prefix and prefix.startswith('date'):
+            return '%s::date' % PARAM.sub(r'$\1', literal)
+
+        if prefix and suffix:
+            # interval ':1' day
+            return "%s::integer * interval '1' day" \
+                % PARAM.sub(r'$\1', literal)
+
+        # like patterns such as '%:1%:2%' are built by concatenation
+        parts = []
+        for k, part in enumerate(PARAM.split(literal)):
+            if k % 2:
+                parts.append('$%s' % part)
+            elif part:
+                parts.append("'%s'" % part)
+
+        if len(parts) == 1:
+            return parts[0]
+
+        return '(%s)' % ' || '.join(parts)
+
+    def pattern(self, text):
+        "Return a regexp matching TEXT, with its parameters as groups."
+        regexp = []
+        position = 0
+
+        for m in PARAM.finditer(text):
+            regexp.append(self.literal(text[position:m.start()]))
+            regexp.append(self.group(m.group(1)))
+            position = m.end()
+
+        regexp.append(self.literal(text[position:]))
+        return ''.join(regexp)
+
+    def literal(self, text):
+        "qgen might change the spacing, match any of it."
+        return r'\s*'.join(re.escape(word) for word in SPACES.split(text))
+
+    def group(self, param):
+        "The same parameter has the same value everywhere in the query."
+        if param in self.params:
+            return '(?P=p%s)' % param
+
+        self.params.add(param)
+        return '(?P<p%s>.*?)' % param
+
+    def bind(self, sql):
+        """Return the parameters of SQL, a query rendered by qgen from this
+        template, as a list of strings in the prepared statement order.
+
+        """
+        m = self.regexp.fullmatch(clean(sql))
+
+        if m is None:
+            raise ValueError("query %s doesn't match its template" % self.name)
+
+        return [m.group('p%d' % (n + 1)) for n in range(len(self.params))]
+
+    def explain(self, sql):
+        "Return the EXPLAIN statement that executes SQL, and its parameters."
+        params = self.bind(sql)
+        return EXPLAIN % (self.name, ', '.join(['%s'] * len(params))), params
+
+
+def clean(text):
+    "Remove comments and the final semicolon from the query TEXT."
+    lines = [line for line in text.splitlines()
+             if not line.strip().startswith('--')]
+
+    return '\n'.join(lines).strip().rstrip(';').strip()
+
+
+def parse(name, text):
+    """Parse the query template TEXT, and return a Template, or None when
+    the query can't be prepared, such as Q15 which creates a view.
+
+    """
+    if ':s' in text:
+        return None
+
+    lines = []
+    for line in text.splitlines():
+        if line.strip() in (':x', ':o'):
+            continue
+
+        m = LIMIT.match(line.strip())
+        if m:
+            if int(m.group(1)) > 0:
+                lines.append('LIMIT %s' % m.group(1))
+            continue
+
+        lines.append(line)
+
+    template = Template(name, clean('\n'.join(lines)))
+
+    # $1, $2, etc. must all be used for the server to know their types
+    if template.params != set(str(n + 1) for n in range(len(template.params))):
+        return None
+
+    return template
+
+
+def template(name):
+    "Return the Template for query NAME, reading it only once."
+    if name not in _templates:
+        filename = os.path.join(TEMPLATES, '%s.sql' % name)
+
+        with open(filename) as f:
+            _templates[name] = parse(name, f.read())
+
+    return _templates[name]
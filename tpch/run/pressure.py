@@ -0,0 +1,178 @@
+import time
+import logging
+import psycopg2
+
+# Adaptive load concurrency: start with a few dbgen processes and add or
+# remove one at a time, depending on the ingest rate and on what the server
+# tells us. The ingest rate is the WAL write rate when the server exposes
+# it, and the rows of the load units done otherwise.
+#
+# Every INTERVAL seconds:
+#   - sessions waiting on locks: one worker less
+#   - requested checkpoints, and the ingest rate didn't improve: one worker
+#     less, bulk loads request checkpoints all the time with the default
+#     max_wal_size, that's only pressure when it costs us throughput
+#   - the ingest rate improved by more than GAIN: one worker more
+#   - the ingest rate dropped by more than GAIN: one worker less
+#   - otherwise, keep the same number of workers
+START    = 2
+INTERVAL = 30
+GAIN     = 0.05
+
+# the first query that works is used, older PostgreSQL versions and some
+# managed services don't have all of them
+WAL_QUERIES = [
+    "select pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')",
+    "select pg_xlog_location_diff(pg_current_xlog_location(), '0/0')"
+]
+
+CHECKPOINT_QUERIES = [
+    "select checkpoints_req from pg_stat_bgwriter",
+    "select num_requested from pg_stat_checkpointer"
+]
+
+LOCK_QUERIES = [
+    "select count(*) from pg_stat_activity where wait_event_type = 'Lock'"
+]
+
+
+class ServerSignals():
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.conn = None
+
+        # the queries that work on this server, None when none does
+        self.queries = {'wal': WAL_QUERIES,
+                        'checkpoints': CHECKPOINT_QUERIES,
+                        'lock_waits': LOCK_QUERIES}
+
+    def connect(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(self.dsn)
+            self.conn.autocommit = True
+        return self.conn
+
+    def close(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def fetch(self, name):
+        "Return the current value of the signal NAME, or None."
+        queries = self.queries[name]
+
+        while queries:
+            try:
+                with self.connect().cursor() as curs:
+                    curs.execute(queries[0])
+                    return float(curs.fetchone()[0])
+
+            except psycopg2.ProgrammingError:
+                # this server doesn't know about that, try the next query
+                queries = self.queries[name] = queries[1:]
+
+            except psycopg2.Error as e:
+                logging.getLogger('TPCH').warning(
+                    'failed to fetch %s from the server: %s', name, e)
+                self.close()
+                return None
+
+        return None
+
+    def sample(self):
+        "Return a dict of the current values of the server signals."
+        return {name: self.fetch(name) for name in self.queries}
+
+
+class Controller():
+    def __init__(self, dsn, cpu, start=START, interval=INTERVAL, gain=GAIN):
+        self.signals = ServerSignals(dsn)
+        self.max = cpu
+        self.workers = min(start, cpu)
+        self.interval = interval
+        self.gain = gain
+
+        self.rows = 0
+        self.best = None
+        self.last = None        # (timestamp, rows, signals) of last sample
+
+    def observe(self, rows):
+        "Account for ROWS more rows loaded."
+        self.rows += rows
+
+    def tick(self):
+        """Sample the server signals when INTERVAL seconds have passed since
+        the previous sample, and return how many workers to use now with the
+        reason why, or None when nothing changed.
+
+        """
+        now = time.monotonic()
+
+        if self.last and now - self.last[0] < self.interval:
+            return None
+
+        signals = self.signals.sample()
+        last, self.last = self.last, (now, self.rows, signals)
+
+        if last is None:
+            return None
+
+        secs = now - last[0]
+        prev = last[2]
+
+        def delta(name):
+            if signals[name] is None or prev[name] is None:
+                return None
+            return signals[name] - prev[name]
+
+        wal = delta('wal')
+        checkpoints = delta('checkpoints')
+
+        if wal is not None:
+            rate, unit = wal / secs, 'WAL bytes/s'
+        else:
+            rate, unit = (self.rows - last[1]) / secs, 'rows/s'
+
+        # what the decision is based on, for the logs
+        inputs = '%.0f %s, best %.0f, %d requested checkpoints, ' \
+            '%d sessions waiting on locks' % (rate, unit, self.best or 0,
+                                              checkpoints or 0,
+                                              signals['lock_waits'] or 0)
+
+        logging.getLogger('TPCH').debug('load pressure: %d workers, %s',
+                                        self.workers, inputs)
+
+        if signals['lock_waits']:
+            return self.set(self.workers - 1, 'lock waits: %s' % inputs)
+
+        # no unit is done yet, and the server doesn't tell the WAL rate
+        if rate == 0:
+            return None
+
+        improved = self.best is None or rate > self.best * (1 + self.gain)
+
+        if checkpoints and not improved:
+            return self.set(self.workers - 1,
+                            'checkpoints without gains: %s' % inputs)
+
+        if improved:
+            self.best = rate
+            return self.set(self.workers + 1, 'rate improved: %s' % inputs)
+
+        if rate < self.best * (1 - self.gain):
+            self.best = rate
+            return self.set(self.workers - 1, 'rate dropped: %s' % inputs)
+
+        return None
+
+    def set(self, workers, reason):
+        workers = max(1, min(self.max, workers))
+
+        if workers == self.workers:
+            return None
+
+        self.workers = workers
+        return workers, reason
+
+    def close(self):
+        self.signals.close()
@@ -0,0 +1,94 @@
+import os
+import re
+import os.path
+import random
+
+from . import utils
+
+TPCH_SRC = os.path.join(os.path.dirname(__file__),
+                        '..',
+                        '..',
+                        'tpch-pg',
+                        'src')
+
+# qgen is run from within TPCH_SRC, where it finds dists.dss
+QUERIES  = '../queries/'
+QGEN     = './qgen -c -r %d %s'
+QGEN_SF  = './qgen -c -r %d -s %s %s'
+
+# the power and throughput tests run the 22 queries in the order given by
+# the TPC-H permutation of the query stream, see qgen -p
+PERMUTATION = './qgen -c -r %d -p %d -s %s'
+
+# each query template begins with this comment line, which qgen keeps in
+# its output thanks to the -c option: we use it to split the stream
+QUERY_SEP = '-- $ID$'
+
+# the next comment line of the query templates has the query number
+QUERY_NAME = re.compile(r'[(]Q(\d+)[)]')
+
+
+def seed():
+    "Return a random seed for qgen, distinct in each worker process."
+    # forked worker processes share the random module state, and qgen
+    # itself uses time(NULL) which has a resolution of one second
+    return random.SystemRandom().randrange(1, 2**31 - 1)
+
+
+def command(queries, rndm=None, sf=None):
+    "Return the qgen command line and environment for the QUERIES stream."
+    env = dict(os.environ)
+    env['DSS_QUERY'] = QUERIES
+
+    if sf:
+        return QGEN_SF % (rndm or seed(), sf, queries), env
+
+    return QGEN % (rndm or seed(), queries), env
+
+
+def render(queries, rndm=None, sf=None):
+    """Run qgen for the QUERIES stream (a space separated list of query
+    numbers), and return a list of (name, sql) tuples, in stream order.
+
+    """
+    cmd, env = command(queries, rndm, sf)
+    out, err = utils.run_command(cmd, cwd=TPCH_SRC, env=env)
+
+    if err:
+        raise RuntimeError("qgen failed: %s" % ' '.join(err))
+
+    return list(zip(queries.split(), split(out)))
+
+
+def permutation(stream, sf, rndm=None):
+    """Run qgen for the 22 queries of the query stream number STREAM, for
+    scale factor SF, and return a list of (name, sql) tuples in the TPC-H
+    permutation order of the stream.
+
+    """
+    env = dict(os.environ)
+    env['DSS_QUERY'] = QUERIES
+
+    cmd = PERMUTATION % (rndm or seed(), stream, sf)
+    out, err = utils.run_command(cmd, cwd=TPCH_SRC, env=env)
+
+    if err:
+        raise RuntimeError("qgen failed: %s" % ' '.join(err))
+
+    return [(QUERY_NAME.search(sql).group(1), sql) for sql in split(out)]
+
+
+def split(lines):
+    "Split qgen output LINES into a list of SQL texts, one per query."
+    blocks = []
+    current = None
+
+    for line in lines:
+        if line.startswith(QUERY_SEP):
+            current = []
+            blocks.append(current)
+
+        if current is not None:
+            current.append(line)
+
+    return ['\n'.join(block) for block in blocks]
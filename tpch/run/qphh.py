@@ -0,0 +1,131 @@
+import time
+import psycopg2
+import concurrent.futures
+from datetime import datetime
+
+from . import qgen, refresh
+from .stream import execute
+from .helpers import TpchComponent
+
+
+def query_stream(dsn, stream, sf, rndm, system):
+    """Run the 22 queries of the query stream number STREAM in their TPC-H
+    permutation order, on a connection of our own. Return a list of (name,
+    duration) tuples, where duration is None when the query failed.
+
+    """
+    timings = []
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+
+    try:
+        for name, sql in qgen.permutation(stream, sf, rndm):
+            timings.append((name, execute(conn, sql, name, system)))
+    finally:
+        conn.close()
+
+    return timings
+
+
+class Power(TpchComponent):
+    def __init__(self, conf, dsn, logger, track):
+        super().__init__(conf, dsn, logger, track)
+        # conf is expected to be a Power namedtuple, see setup.py
+        self.sf = self.conf.scale_factor
+
+    def run(self, system, phase):
+        """Run the TPC-H power test: RF1, then the query stream 0, then RF2,
+        one after the other. See the power view in the tracking database
+        for the Power@Size metric.
+
+        """
+        self.system = system
+
+        start = datetime.now()
+        job_id = self.track.register_job(phase, start)
+        self.track.register_tpch_test(job_id, 'power', self.sf, 1)
+        updset, = self.track.reserve_update_sets(job_id, 1)
+
+        self.log("Running the TPC-H power test at SF %d, update set %d",
+                 self.sf, updset)
+
+        t0 = time.monotonic()
+        rf_start = datetime.now()
+        rf1 = refresh.refresh(self.dsn, self.sf, updset, 'RF1', system)
+        timings = query_stream(self.dsn, 0, self.sf, qgen.seed(), system)
+        rf2 = refresh.refresh(self.dsn, self.sf, updset, 'RF2', system)
+        secs = time.monotonic() - t0
+
+        self.track.register_job_time(job_id, secs)
+        self.track.register_refresh(job_id, updset, rf_start, rf1, rf2)
+
+        failed = 0
+        for name, duration in timings:
+            if duration is None:
+                failed += 1
+            else:
+                self.track.register_query_timings(job_id, name, duration)
+
+        self.log("power test done in %gs, %d queries failed", secs, failed)
+        return
+
+
+class Throughput(TpchComponent):
+    def __init__(self, conf, dsn, logger, track):
+        super().__init__(conf, dsn, logger, track)
+        # conf is expected to be a Throughput namedtuple, see setup.py
+        self.sf = self.conf.scale_factor
+        self.streams = self.conf.streams
+
+    def run(self, system, phase):
+        """Run the TPC-H throughput test: STREAMS query streams concurrently
+        with a refresh stream that runs a refresh pair per query stream.
+        See the throughput view in the tracking database for the
+        Throughput@Size metric.
+
+        """
+        self.system = system
+
+        start = datetime.now()
+        job_id = self.track.register_job(phase, start)
+        self.track.register_tpch_test(job_id, 'throughput',
+                                      self.sf, self.streams)
+        updsets = self.track.reserve_update_sets(job_id, self.streams)
+
+        self.log("Running the TPC-H throughput test at SF %d "
+                 "with %d query streams, update sets %d..%d",
+                 self.sf, self.streams, updsets[0], updsets[-1])
+
+        # query streams are numbered from 1 in the throughput test, and
+        # each of them uses its own qgen seed
+        rndm = qgen.seed()
+
+        t0 = time.monotonic()
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.streams + 1) as executor:
+            queries = [executor.submit(query_stream, self.dsn, s, self.sf,
+                                       rndm + s, system)
+                       for s in range(1, self.streams + 1)]
+
+            rf = executor.submit(refresh.refresh_stream,
+                                 self.dsn, self.sf, updsets, system)
+
+            concurrent.futures.wait(queries + [rf])
+        secs = time.monotonic() - t0
+
+        self.track.register_job_time(job_id, secs)
+
+        failed = 0
+        for future in queries:
+            for name, duration in future.result():
+                if duration is None:
+                    failed += 1
+                else:
+                    self.track.register_query_timings(job_id, name, duration)
+
+        for updset, rf_start, rf1, rf2 in rf.result():
+            self.track.register_refresh(job_id, updset, rf_start, rf1, rf2)
+
+        self.log("throughput test done in %gs, %d queries failed",
+                 secs, failed)
+        return
@@ -0,0 +1,126 @@
+import os.path
+import time
+import logging
+from datetime import datetime, timedelta
+
+from . import utils
+from .helpers import TpchComponent
+
+MAKEFILE = os.path.join(os.path.dirname(__file__),
+                        '..',
+                        '..',
+                        'Makefile.loader')
+
+# dbgen generates the update set S and applies it directly to the database,
+# either the RF1 inserts of new sales or the RF2 deletes of old sales
+REFRESH = 'make -f %s SF=%s S=%d DSN=%s %s'
+
+FUNCTIONS = {'RF1': 'rf1', 'RF2': 'rf2'}
+
+
+def refresh(dsn, sf, updset, name, system):
+    """Run the refresh function NAME (either RF1 or RF2) for the update set
+    number UPDSET, return how much time it took as a timedelta, or None
+    when it failed.
+
+    """
+    command = REFRESH % (MAKEFILE, sf, updset, dsn, FUNCTIONS[name])
+
+    start = time.perf_counter_ns()
+    out, err = utils.run_command(command)
+    end = time.perf_counter_ns()
+
+    if err:
+        logger = logging.getLogger('TPCH')
+        logger.error(command)
+        for line in err:
+            logger.error('%s: %s %d: %s', system, name, updset, line)
+        return None
+
+    return timedelta(microseconds=(end - start) / 1000)
+
+
+def refresh_pair(dsn, sf, updset, system):
+    """Run RF1 then RF2 for the update set number UPDSET, return when we
+    started and both timings.
+
+    """
+    start = datetime.now()
+    rf1 = refresh(dsn, sf, updset, 'RF1', system)
+    rf2 = refresh(dsn, sf, updset, 'RF2', system)
+
+    return start, rf1, rf2
+
+
+def refresh_stream(dsn, sf, updsets, system):
+    """The refresh stream of the throughput test runs a refresh pair per
+    query stream, one after the other. Return a list of (updset, start,
+    rf1, rf2).
+
+    """
+    return [(updset,) + refresh_pair(dsn, sf, updset, system)
+            for updset in updsets]
+
+
+class Refresh(TpchComponent):
+    def __init__(self, conf, dsn, logger, track):
+        super().__init__(conf, dsn, logger, track)
+        # conf is expected to be a Refresh namedtuple, see setup.py
+        self.sf = self.conf.scale_factor
+        self.duration = self.conf.duration
+        self.rate = self.conf.rate
+
+    def run(self, system, phase):
+        """Apply refresh pairs for DURATION seconds, at RATE pairs per minute,
+        or one after the other when no rate is given. Schedule this job
+        along with stream jobs to measure QPM under a write load.
+
+        """
+        self.system = system
+
+        if self.rate:
+            self.log("Applying %g refresh pairs per minute for %ds",
+                     self.rate, self.duration)
+        else:
+            self.log("Applying refresh pairs for %ds", self.duration)
+
+        start = datetime.now()
+        job_id = self.track.register_job(phase, start)
+
+        pairs = 0
+        t0 = time.monotonic()
+        deadline = t0 + self.duration
+        next_pair = t0
+
+        while time.monotonic() < deadline:
+            # each update set can only be applied once, reserve the next
+            # one just before using it
+            updset, = self.track.reserve_update_sets(job_id, 1)
+
+            pair_start, rf1, rf2 = refresh_pair(self.dsn, self.sf, updset,
+                                                system)
+            self.track.register_refresh(job_id, updset, pair_start, rf1, rf2)
+            pairs += 1
+
+            if rf1 is None or rf2 is None:
+                # don't burn update sets as fast as dbgen fails
+                self.log("update set %d failed, stopping", updset)
+                break
+
+            self.log("update set %d: RF1 in %s, RF2 in %s", updset, rf1, rf2)
+
+            if self.rate:
+                # when we're late, don't try to catch up with a burst
+                now = time.monotonic()
+                next_pair = max(next_pair + 60.0 / self.rate, now)
+
+                if next_pair < deadline:
+                    time.sleep(next_pair - now)
+                else:
+                    break
+
+        secs = time.monotonic() - t0
+        self.track.register_job_time(job_id, secs)
+
+        self.log("applied %d refresh pairs in %gs", pairs, secs)
+        return
@@ -0,0 +1,86 @@
+from .stream import Stream
+from .setup import Stream as StreamConf
+from .helpers import TpchComponent
+
+
+class Saturation(TpchComponent):
+    def __init__(self, conf, dsn, logger, track):
+        super().__init__(conf, dsn, logger, track)
+        # conf is expected to be a Saturation namedtuple, see setup.py
+        self.start = self.conf.start
+        self.step = self.conf.step
+        self.max = self.conf.max
+        self.plateau = self.conf.plateau
+        self.latency = self.conf.latency
+
+    def levels(self):
+        "Return the list of concurrency levels to try, in order."
+        return list(range(self.start, self.max + 1, self.step))
+
+    def stage(self, cpu):
+        "Return a Stream job for a stage of the search at CPU concurrency."
+        return StreamConf(queries  = self.conf.queries,
+                          duration = self.conf.duration,
+                          cpu      = cpu,
+                          mode     = self.conf.mode,
+                          engine   = 'process',
+                          users    = cpu,
+                          arrival  = 'closed',
+                          rate     = None,
+                          corpus   = None,
+                          seed     = None,
+                          raw      = True,
+                          scale_factor = None)
+
+    def run(self, system, phase):
+        """Ramp up the number of concurrent streams stage by stage, until
+        the QPM doesn't improve by more than PLATEAU percent over the best
+        stage so far, or the 95th percentile of query latency crosses the
+        LATENCY limit, in milliseconds.
+
+        """
+        self.system = system
+        self.log("Searching for peak QPM with %s concurrent streams",
+                 ', '.join(str(x) for x in self.levels()))
+
+        best = None             # (stage, job_id, cpu, qpm) of the knee
+        curve = []
+
+        for n, cpu in enumerate(self.levels(), 1):
+            name = '%s/%d' % (phase, cpu)
+            cmd = Stream(self.stage(cpu), self.dsn, self.logger, self.track)
+            cmd.run(system, name)
+
+            job_id = cmd.pool.stream_id
+            p95 = cmd.pool.latencies.percentile(95)
+            if p95 is not None:
+                p95 = p95 / 1000.0
+
+            self.track.register_saturation_stage(
+                job_id, phase, n, cpu, cmd.qpm, p95)
+
+            curve.append((cpu, cmd.qpm, p95))
+            self.log("stage %d: %d streams, %gQPM, p95 %gms",
+                     n, cpu, cmd.qpm, p95 or 0)
+
+            if p95 is not None and self.latency and p95 > self.latency:
+                self.log("p95 latency above %gms, stopping", self.latency)
+                break
+
+            if best and cmd.qpm < best[3] * (1 + self.plateau / 100.0):
+                self.log("QPM gain below %g%%, stopping", self.plateau)
+
+                # still, we might have found a better stage, just barely
+                if cmd.qpm > best[3]:
+                    best = (n, job_id, cpu, cmd.qpm)
+                break
+
+            best = (n, job_id, cpu, cmd.qpm)
+
+        if best:
+            n, job_id, cpu, qpm = best
+            self.track.register_saturation_knee(job_id)
+            self.log("peak QPM %g reached with %d concurrent streams",
+                     qpm, cpu)
+
+        return curve
@@ -6,6 +6,9 @@ from . import utils, logs
 from .load import Load
 from .stream import Stream
 from .initdb import InitDB
+from .saturation import Saturation
+from .qphh import Power, Throughput
+from .refresh import Refresh
 from .tracking import Tracking
 from .helpers import TpchComponent
 
@@ -106,6 +109,22 @@ class Schedule(TpchComponent):
                                self.dsn, self.schema, self.logger, self.track)
                     cmd.run(self.system, phase)
 
+                elif type(job).__name__ == 'Saturation':
+                    cmd = Saturation(job, self.dsn, self.logger, self.track)
+                    cmd.run(self.system, phase)
+
+                elif type(job).__name__ == 'Power':
+                    cmd = Power(job, self.dsn, self.logger, self.track)
+                    cmd.run(self.system, phase)
+
+                elif type(job).__name__ == 'Throughput':
+                    cmd = Throughput(job, self.dsn, self.logger, self.track)
+                    cmd.run(self.system, phase)
+
+                elif type(job).__name__ == 'Refresh':
+                    cmd = Refresh(job, self.dsn, self.logger, self.track)
+                    cmd.run(self.system, phase)
+
                 else:
                     raise ValueError(
                         "I don't know how to do %s, which is a %s" %
@@ -126,6 +145,7 @@ class Schedule(TpchComponent):
         self.end = time.monotonic()
 
         self.track.register_run_time(self.end - self.start)
+        self.track.close()
 
         if not self.recursive:
             self.log('schedule %s done in %gs',
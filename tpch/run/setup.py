@@ -6,11 +6,29 @@ from collections import namedtuple
 from . import utils
 
 Scale   = namedtuple('Scale', 'cpu factor children')
-Stream  = namedtuple('Stream', 'queries duration cpu')
-Load    = namedtuple('Load', 'scale_factor children steps cpu')
+Stream  = namedtuple('Stream',
+                     'queries duration cpu mode engine users arrival rate '
+                     'corpus seed raw scale_factor')
+Load    = namedtuple('Load',
+                     'scale_factor children steps cpu split adaptive format')
+Saturation = namedtuple('Saturation',
+                        'queries duration mode start step max plateau latency')
+Power   = namedtuple('Power', 'scale_factor')
+Throughput = namedtuple('Throughput', 'scale_factor streams')
+Refresh = namedtuple('Refresh', 'scale_factor duration rate')
 Schema  = namedtuple('Schema', 'tables constraints drop vacuum')
 Results = namedtuple('Results', 'dsn')
 
+STREAM_MODES   = ('psql', 'driver', 'prepared')
+STREAM_ENGINES = ('process', 'async')
+ARRIVALS       = ('closed', 'constant', 'poisson')
+LOAD_SPLITS    = ('table', 'step')
+COPY_FORMATS   = ('text', 'binary')
+
+# minimum number of query streams of the throughput test, per scale factor
+MIN_STREAMS    = ((1, 2), (10, 3), (30, 4), (100, 5), (300, 6), (1000, 7),
+                  (3000, 8), (10000, 9), (30000, 10), (100000, 11))
+
 
 class Setup():
     def __init__(self, filename):
@@ -41,11 +59,39 @@ class Setup():
                     else:
                         cpu = self.scale.cpu
 
+                    # load each table of a step in its own dbgen process,
+                    # or all the tables of the step in the same process
+                    split = 'table'
+                    if self.conf.has_option(section, 'split'):
+                        split = self.conf.get(section, 'split')
+
+                    if split not in LOAD_SPLITS:
+                        raise ValueError("%s: unknown load split %s"
+                                         % (section, split))
+
+                    # adaptive loads start with a few workers, and use up
+                    # to cpu of them depending on the server, see pressure.py
+                    adaptive = False
+                    if self.conf.has_option(section, 'adaptive'):
+                        adaptive = self.conf.getboolean(section, 'adaptive')
+
+                    # the COPY format dbgen sends the rows in
+                    copy_format = 'text'
+                    if self.conf.has_option(section, 'format'):
+                        copy_format = self.conf.get(section, 'format')
+
+                    if copy_format not in COPY_FORMATS:
+                        raise ValueError("%s: unknown COPY format %s"
+                                         % (section, copy_format))
+
                     job = Load(
                         scale_factor = self.scale.factor,
                         children     = self.scale.children,
                         steps        = steps,
-                        cpu          = cpu
+                        cpu          = cpu,
+                        split        = split,
+                        adaptive     = adaptive,
+                        format       = copy_format
                     )
                     self.jobs[section] = job
 
@@ -58,7 +104,177 @@ class Setup():
                     else:
                         cpu = self.scale.cpu
 
-                    job = Stream(queries=queries, duration=duration, cpu=cpu)
+                    # closed-loop streams start a new stream as soon as
+                    # one is done, open-loop streams issue queries at a
+                    # given rate, in queries per minute
+                    arrival = 'closed'
+                    if self.conf.has_option(section, 'arrival'):
+                        arrival = self.conf.get(section, 'arrival')
+
+                    if arrival not in ARRIVALS:
+                        raise ValueError("%s: unknown arrival %s"
+                                         % (section, arrival))
+
+                    rate = None
+                    if arrival != 'closed':
+                        rate = self.conf.getfloat(section, 'rate')
+
+                        if rate <= 0:
+                            raise ValueError("%s: rate must be positive"
+                                             % section)
+
+                    # open-loop streams are implemented in the async engine
+                    engine = 'process'
+                    if arrival != 'closed':
+                        engine = 'async'
+
+                    if self.conf.has_option(section, 'engine'):
+                        engine = self.conf.get(section, 'engine')
+
+                    if engine not in STREAM_ENGINES:
+                        raise ValueError("%s: unknown stream engine %s"
+                                         % (section, engine))
+
+                    # the async engine runs the queries from within the
+                    # driver, that's the only mode it knows about
+                    mode = 'psql'
+                    if engine == 'async':
+                        mode = 'driver'
+
+                    if self.conf.has_option(section, 'mode'):
+                        mode = self.conf.get(section, 'mode')
+
+                    if mode not in STREAM_MODES:
+                        raise ValueError("%s: unknown stream mode %s"
+                                         % (section, mode))
+
+                    if engine == 'async' and mode != 'driver':
+                        raise ValueError("%s: the async engine only supports "
+                                         "the driver mode" % section)
+
+                    if arrival != 'closed' and engine != 'async':
+                        raise ValueError("%s: open-loop arrival needs the "
+                                         "async engine" % section)
+
+                    # virtual users of the async engine, default to cpu
+                    users = cpu
+                    if self.conf.has_option(section, 'users'):
+                        users = self.conf.getint(section, 'users')
+
+                    # how many variants per query to pre-render with qgen,
+                    # by default we run qgen for each stream
+                    corpus = None
+                    if self.conf.has_option(section, 'corpus'):
+                        corpus = self.conf.getint(section, 'corpus')
+
+                        if corpus < 1:
+                            raise ValueError("%s: corpus must be positive"
+                                             % section)
+
+                        if mode == 'psql':
+                            raise ValueError("%s: the psql mode doesn't "
+                                             "support a corpus" % section)
+
+                    # the corpus seed defaults to a hash of the run name
+                    seed = None
+                    if self.conf.has_option(section, 'seed'):
+                        seed = self.conf.getint(section, 'seed')
+
+                    # one query row per execution, or only the histograms
+                    raw = True
+                    if self.conf.has_option(section, 'raw'):
+                        raw = self.conf.getboolean(section, 'raw')
+
+                    job = Stream(queries=queries,
+                                 duration=duration,
+                                 cpu=cpu,
+                                 mode=mode,
+                                 engine=engine,
+                                 users=users,
+                                 arrival=arrival,
+                                 rate=rate,
+                                 corpus=corpus,
+                                 seed=seed,
+                                 raw=raw,
+                                 scale_factor=self.scale.factor)
+                    self.jobs[section] = job
+
+                elif self.conf.get(section, 'type') == 'saturation':
+                    mode = 'psql'
+                    if self.conf.has_option(section, 'mode'):
+                        mode = self.conf.get(section, 'mode')
+
+                    if mode not in STREAM_MODES:
+                        raise ValueError("%s: unknown stream mode %s"
+                                         % (section, mode))
+
+                    start = 1
+                    if self.conf.has_option(section, 'start'):
+                        start = self.conf.getint(section, 'start')
+
+                    step = 1
+                    if self.conf.has_option(section, 'step'):
+                        step = self.conf.getint(section, 'step')
+
+                    # stop when QPM improves by less than 5% by default
+                    plateau = 5.0
+                    if self.conf.has_option(section, 'plateau'):
+                        plateau = self.conf.getfloat(section, 'plateau')
+
+                    # p95 latency limit in milliseconds, none by default
+                    latency = None
+                    if self.conf.has_option(section, 'latency'):
+                        latency = self.conf.getfloat(section, 'latency')
+
+                    maximum = self.conf.getint(section, 'max')
+
+                    if start < 1 or step < 1:
+                        raise ValueError("%s: start and step must be "
+                                         "positive" % section)
+
+                    if maximum < start:
+                        raise ValueError("%s: max must not be lower than "
+                                         "start" % section)
+
+                    job = Saturation(
+                        queries  = self.conf.get(section, 'queries'),
+                        duration = self.conf.getint(section, 'duration'),
+                        mode     = mode,
+                        start    = start,
+                        step     = step,
+                        max      = maximum,
+                        plateau  = plateau,
+                        latency  = latency
+                    )
+                    self.jobs[section] = job
+
+                elif self.conf.get(section, 'type') == 'power':
+                    job = Power(scale_factor = self.scale.factor)
+                    self.jobs[section] = job
+
+                elif self.conf.get(section, 'type') == 'throughput':
+                    if self.conf.has_option(section, 'streams'):
+                        streams = self.conf.getint(section, 'streams')
+                    else:
+                        streams = min_streams(self.scale.factor)
+
+                    job = Throughput(
+                        scale_factor = self.scale.factor,
+                        streams      = streams
+                    )
+                    self.jobs[section] = job
+
+                elif self.conf.get(section, 'type') == 'refresh':
+                    # refresh pairs per minute, back to back by default
+                    rate = None
+                    if self.conf.has_option(section, 'rate'):
+                        rate = self.conf.getfloat(section, 'rate')
+
+                    job = Refresh(
+                        scale_factor = self.scale.factor,
+                        duration     = self.conf.getint(section, 'duration'),
+                        rate         = rate
+                    )
                     self.jobs[section] = job
 
         self.pgsql = Schema(
@@ -152,3 +368,14 @@ class Setup():
                 config[section][option] = value
 
         return json.dumps(config, indent=1)
+
+
+def min_streams(sf):
+    "Return the minimum number of query streams for scale factor SF."
+    streams = MIN_STREAMS[0][1]
+
+    for scale, count in MIN_STREAMS:
+        if sf >= scale:
+            streams = count
+
+    return streams
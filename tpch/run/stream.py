@@ -1,10 +1,15 @@
 import os
 import os.path
 import time
+import random
+import asyncio
 import logging
-from datetime import datetime
+import weakref
+import psycopg2
+from datetime import datetime, timedelta
 
-from . import utils
+from . import utils, qgen, corpus, connection, vusers, prepared, histogram
+from .writer import TrackingWriter
 from .task_pool import TaskPool
 from .helpers import TpchComponent
 
@@ -29,24 +34,493 @@ def stream(dsn, queries, system):
     return utils.parse_psql_timings(queries, out)
 
 
+def driver_stream(dsn, queries, system):
+    """Run the QUERIES stream from within the driver: qgen renders the
+    queries, which we then send over the worker's persistent connection,
+    timing each of them on the client side.
+
+    """
+    return run_stream(dsn, qgen.render(queries), system)
+
+
+def prepared_stream(dsn, queries, system):
+    """Run the QUERIES stream from within the driver, using a prepared
+    statement per query template.
+
+    """
+    return run_prepared_stream(dsn, qgen.render(queries), system)
+
+
+def run_prepared_stream(dsn, stream, system):
+    "Run the already rendered STREAM with prepared statements."
+    return run_stream(dsn, stream, system, fun=execute_prepared)
+
+
+def run_stream(dsn, stream, system, fun=None):
+    """Run the already rendered STREAM, a list of (name, sql) tuples, over
+    the worker's persistent connection.
+
+    """
+    fun = fun or execute
+    timings = {}
+    conn = connection.get_connection(dsn)
+
+    try:
+        for name, sql in stream:
+            duration = fun(conn, sql, name, system)
+
+            if conn.closed:
+                # the server went away in the middle of the stream,
+                # reconnect transparently and run the query again
+                conn = connection.connect(dsn)
+                duration = fun(conn, sql, name, system)
+
+            if duration is not None:
+                timings[name] = duration
+    finally:
+        connection.release(conn)
+
+    return timings
+
+
+def execute(conn, sql, name, system):
+    """Execute query SQL on CONN and fetch its result set, return how much
+    time it took as a timedelta, or None when the query failed.
+
+    """
+    curs = conn.cursor()
+    start = time.perf_counter_ns()
+
+    try:
+        curs.execute(sql)
+        if curs.description:
+            curs.fetchall()
+    except psycopg2.Error as e:
+        query_failed(conn, name, system, e)
+        return None
+    finally:
+        end = time.perf_counter_ns()
+        curs.close()
+
+    return timedelta(microseconds=(end - start) / 1000)
+
+
+# the query templates already prepared on each connection
+PREPARED = weakref.WeakKeyDictionary()
+
+
+def execute_prepared(conn, sql, name, system):
+    """Execute query SQL on CONN with the prepared statement of its template,
+    preparing it first when needed. Return a prepared.Timing with the total
+    duration as seen from the client and the planning and execution times
+    as reported by the server, or None when the query failed.
+
+    """
+    template = prepared.template(name)
+
+    if template is None:
+        # some queries can't be prepared, run them as usual
+        duration = execute(conn, sql, name, system)
+        if duration is None:
+            return None
+        return prepared.Timing(duration, None, None)
+
+    curs = conn.cursor()
+
+    try:
+        if name not in PREPARED.setdefault(conn, set()):
+            curs.execute(template.sql)
+            PREPARED[conn].add(name)
+
+        statement, params = template.explain(sql)
+
+        start = time.perf_counter_ns()
+        curs.execute(statement, params)
+        summary, = curs.fetchone()[0]
+        end = time.perf_counter_ns()
+
+    except psycopg2.Error as e:
+        query_failed(conn, name, system, e)
+        return None
+    finally:
+        curs.close()
+
+    return prepared.Timing(
+        timedelta(microseconds=(end - start) / 1000),
+        timedelta(milliseconds=summary['Planning Time']),
+        timedelta(milliseconds=summary['Execution Time']))
+
+
+def query_failed(conn, name, system, e):
+    "Log that query NAME failed on CONN with the error E."
+    logger = logging.getLogger('TPCH')
+    if conn.closed:
+        logger.warning('%s: connection lost during query %s: %s',
+                       system, name, e)
+    else:
+        logger.error('%s: query %s failed: %s', system, name, e)
+
+
+# the stream job mode selects how we run a stream of queries
+MODES = {'psql': stream,
+         'driver': driver_stream,
+         'prepared': prepared_stream}
+
+
 class StreamTaskPool(TaskPool):
     def report_progress(self):
         now = time.monotonic()
 
         if now - self.previous_report_time >= self.pause:
             secs = now - self.start
-            self.logger.info('%s: %d query streams executed in %gs, %gQPM',
+            self.logger.info('%s: %d query streams executed in %gs, %gQPM, '
+                             'tracking queue %d',
                              self.system,
                              len(self.tasks_done),
                              secs,
-                             len(self.tasks_done) / secs * 60.0)
+                             len(self.tasks_done) / secs * 60.0,
+                             self.writer.depth())
             self.previous_report_time = now
 
     def handle_results(self, result):
+        "Account for RESULT, leaving the tracking writes to the writer."
+        self.record(result)
+        self.writer.submit(self.register, result)
+
+        snapshot = self.recorder.snapshot()
+        if snapshot:
+            self.writer.submit(self.track.register_histograms,
+                               self.stream_id, snapshot)
+
+    def record(self, result):
+        "Account for the timings of a stream RESULT in our statistics."
         self.nbs += 1
         for name, duration in result.items():
+            if isinstance(duration, prepared.Timing):
+                duration = duration.duration
+
+            ms = utils.duration_ms(duration)
+
             self.nbq += 1
-            self.track.register_query_timings(self.stream_id, name, duration)
+            self.latencies.record(ms * 1000)
+            self.recorder.record(name, ms * 1000)
+
+    def register(self, result):
+        """Register the timings of a stream RESULT in the tracking database,
+        unless we only keep the latency histograms.
+
+        """
+        if not self.raw:
+            return
+
+        for name, duration in result.items():
+            if isinstance(duration, prepared.Timing):
+                # planning and execution timings are known separately
+                self.track.register_query_timings(self.stream_id, name,
+                                                  *duration)
+            else:
+                self.track.register_query_timings(self.stream_id, name,
+                                                  duration)
+
+    def task_args(self, args):
+        """When using a corpus, send the next stream of the corpus to the
+        worker rather than the list of queries to render.
+
+        """
+        if self.corpus is None:
+            return args
+
+        dsn, queries, system = args
+        stream = self.corpus.stream(queries, self.nbs_submitted)
+        self.nbs_submitted += 1
+
+        return dsn, stream, system
+
+
+class AsyncStreamPool(StreamTaskPool):
+    """The async engine runs many virtual users from a single process: each
+    virtual user is a coroutine holding its own non-blocking connection to
+    the system under test, and runs query streams one after the other for
+    the duration of the job. That allows to drive thousands of concurrent
+    sessions without spending an OS process per session.
+
+    Each stream is rendered with qgen for its own use, as the process engine
+    does, in the background ahead of its use when possible. A corpus of
+    streams rendered before the job starts is used in turn instead.
+
+    """
+    # how many query streams we render ahead of their use, and how many qgen
+    # processes we run at once at most
+    RENDER_AHEAD = 64
+    RENDERERS = 8
+
+    def __init__(self, users, duration, pause=1):
+        super().__init__(users, duration, pause=pause)
+        self.users = users
+
+        self.renderers = []
+        self.reused = 0
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    async def render(self, queries):
+        """Render a first query stream, and start rendering the next ones in
+        the background, without blocking.
+
+        """
+        if self.corpus is not None:
+            self.rendered = [self.corpus.stream(queries, n)
+                             for n in range(self.corpus.variants)]
+            return
+
+        self.queries = queries
+        self.qgen = asyncio.Semaphore(self.RENDERERS)
+        self.streams = asyncio.Queue(maxsize=self.RENDER_AHEAD)
+        self.last = await self.render_stream()
+
+        self.renderers = [asyncio.ensure_future(self.renderer())
+                          for x in range(min(self.users, self.RENDERERS))]
+
+    async def render_stream(self):
+        "Render a new query stream, with RENDERERS qgen processes at most."
+        async with self.qgen:
+            stream = await vusers.render(self.queries)
+
+        self.last = stream
+        return stream
+
+    async def renderer(self):
+        "Keep RENDER_AHEAD query streams ready for the virtual users."
+        try:
+            while True:
+                await self.streams.put(await self.render_stream())
+        except RuntimeError as e:
+            # the virtual users then run qgen themselves, and fail
+            self.logger.error('%s: failed to render query streams: %s',
+                              self.system, e)
+
+    async def stop_rendering(self):
+        for task in self.renderers:
+            task.cancel()
+
+        await asyncio.gather(*self.renderers, return_exceptions=True)
+
+    def ready_stream(self):
+        """Return the next query stream without waiting: a stream rendered
+        ahead when we have one, or the last rendered stream again.
+
+        """
+        self.nbs_submitted += 1
+
+        if self.corpus is not None:
+            return self.rendered[(self.nbs_submitted - 1)
+                                 % len(self.rendered)]
+
+        try:
+            return self.streams.get_nowait()
+        except asyncio.QueueEmpty:
+            self.reused += 1
+            return self.last
+
+    async def next_stream(self):
+        """Return the next query stream, rendering it now when none has been
+        rendered ahead.
+
+        """
+        if self.corpus is not None or not self.streams.empty():
+            return self.ready_stream()
+
+        self.nbs_submitted += 1
+        return await self.render_stream()
+
+    async def vuser(self, fun, dsn, system):
+        "Run FUN streams on a connection of our own until DURATION is over."
+        try:
+            conn = await vusers.connect(dsn)
+        except psycopg2.Error as e:
+            self.logger.error('%s: virtual user failed to connect: %s',
+                              system, e)
+            return
+
+        try:
+            while self.elapsed() < self.duration:
+                if conn.closed:
+                    # the server went away, reconnect transparently
+                    conn = await vusers.connect(dsn)
+
+                stream = await self.next_stream()
+                result = await fun(conn, stream, system)
+
+                self.tasks_done.append(result)
+                self.handle_results(result)
+                self.report_progress()
+        finally:
+            conn.close()
+
+    async def main(self, fun, dsn, queries, system):
+        await self.render(queries)
+        self.start = time.monotonic()
+
+        results = await asyncio.gather(*[self.vuser(fun, dsn, system)
+                                         for x in range(self.users)],
+                                       return_exceptions=True)
+        await self.stop_rendering()
+
+        # a virtual user failing doesn't stop the other ones
+        for result in results:
+            if isinstance(result, Exception):
+                self.logger.error('%s: virtual user failed: %s',
+                                  system, result)
+
+    def run(self, fun, dsn, *args):
+        """Run as many as USERS virtual users concurrently, each of them
+        running FUN streams for DURATION seconds. Return the time we
+        actually took in seconds.
+
+        """
+        asyncio.run(self.main(fun, dsn, *args))
+
+        self.end = time.monotonic()
+        return self.end - self.start
+
+
+class OpenLoopStreamPool(AsyncStreamPool):
+    """The open-loop engine issues queries at a given RATE, in queries per
+    minute, whatever the system under test is doing. When all the USERS
+    connections are busy, arriving queries wait in a backlog until a
+    connection is available.
+
+    The latency of a query is measured from its intended start time rather
+    than from when a connection was available to run it, so that a system
+    pushed past its capacity shows it in the percentiles.
+
+    """
+    def __init__(self, users, duration, arrival, rate, pause=1):
+        super().__init__(users, duration, pause=pause)
+        self.arrival = arrival
+        self.rate = rate
+
+        self.backlog = 0
+        self.max_backlog = 0
+
+    def report_progress(self):
+        now = time.monotonic()
+
+        if now - self.previous_report_time >= self.pause:
+            secs = now - self.start
+            self.logger.info('%s: %d queries executed in %gs, %gQPM, '
+                             'backlog %d (max %d)',
+                             self.system,
+                             len(self.tasks_done),
+                             secs,
+                             len(self.tasks_done) / secs * 60.0,
+                             self.backlog,
+                             self.max_backlog)
+            self.previous_report_time = now
+
+    def interval(self):
+        "Return how many nanoseconds until the next query arrival."
+        if self.arrival == 'poisson':
+            secs = random.expovariate(self.rate / 60.0)
+        else:
+            secs = 60.0 / self.rate
+
+        return int(secs * 10**9)
+
+    def arrivals(self):
+        """Generate (name, sql) tuples from the rendered streams, the arrival
+        clock never waits for qgen.
+
+        """
+        while True:
+            for name, sql in self.ready_stream():
+                yield name, sql
+
+    async def query(self, fun, intended, name, sql, system):
+        "Run query SQL as soon as a connection is available."
+        self.backlog += 1
+        self.max_backlog = max(self.max_backlog, self.backlog)
+
+        conn = await self.idle.get()
+        self.backlog -= 1
+
+        try:
+            if conn.closed:
+                conn = await vusers.connect(self.dsn)
+
+            duration = await fun(conn, sql, name, system)
+        finally:
+            self.idle.put_nowait(conn)
+
+        result = {}
+        if duration is not None:
+            latency = time.perf_counter_ns() - intended
+            result[name] = timedelta(microseconds=latency / 1000)
+
+        self.tasks_done.append(result)
+        self.handle_results(result)
+        self.report_progress()
+
+    async def sample_backlog(self, deadline):
+        while time.monotonic() < deadline:
+            self.writer.submit(self.track.register_backlog,
+                               self.stream_id, self.backlog)
+            await asyncio.sleep(1)
+
+    async def main(self, fun, dsn, queries, system):
+        self.dsn = dsn
+        self.idle = asyncio.Queue()
+
+        # render the queries ahead of their intended start time
+        await self.render(queries)
+
+        conns = await asyncio.gather(*[vusers.connect(dsn)
+                                       for x in range(self.users)],
+                                     return_exceptions=True)
+        for conn in conns:
+            if isinstance(conn, Exception):
+                self.logger.error('%s: failed to connect: %s', system, conn)
+            else:
+                self.idle.put_nowait(conn)
+
+        if self.idle.empty():
+            raise RuntimeError("no connection to the system under test")
+
+        self.start = time.monotonic()
+        deadline = self.start + self.duration
+        sampler = asyncio.ensure_future(self.sample_backlog(deadline))
+
+        pending = set()
+        arrivals = self.arrivals()
+        intended = time.perf_counter_ns()
+
+        while True:
+            name, sql = next(arrivals)
+
+            intended += self.interval()
+            delay = (intended - time.perf_counter_ns()) / 10**9
+
+            if time.monotonic() + delay >= deadline:
+                break
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            task = asyncio.ensure_future(
+                self.query(fun, intended, name, sql, system))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        # wait until the queries already issued are done
+        if pending:
+            await asyncio.wait(pending)
+
+        await sampler
+        await self.stop_rendering()
+
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
 
 
 class Stream(TpchComponent):
@@ -57,14 +531,50 @@ class Stream(TpchComponent):
         self.queries = self.conf.queries
         self.duration = self.conf.duration
         self.cpu = self.conf.cpu
+        self.mode = self.conf.mode
+        self.engine = self.conf.engine
 
         pause = 60
         if self.duration < 90:
             pause = 5
 
-        self.pool = StreamTaskPool(self.cpu, self.duration, pause=pause)
+        if self.conf.arrival != 'closed':
+            # open-loop engine, issuing queries at a given arrival rate
+            self.cpu = self.conf.users
+            self.fun = vusers.execute
+            self.pool = OpenLoopStreamPool(self.cpu, self.duration,
+                                           self.conf.arrival,
+                                           self.conf.rate,
+                                           pause=pause)
+
+        elif self.engine == 'async':
+            # virtual users, all running in this very process
+            self.cpu = self.conf.users
+            self.fun = vusers.driver_stream
+            self.pool = AsyncStreamPool(self.cpu, self.duration, pause=pause)
+
+        else:
+            # in driver mode each worker process keeps its own connection
+            # to the system under test, opened once when the worker starts
+            initializer, initargs = None, ()
+            if self.mode in ('driver', 'prepared'):
+                initializer, initargs = connection.init_worker, (self.dsn,)
+
+            self.fun = MODES[self.mode]
+            self.pool = StreamTaskPool(self.cpu, self.duration, pause=pause,
+                                       initializer=initializer,
+                                       initargs=initargs)
+
         self.pool.track = self.track
         self.pool.logger = logger
+        self.pool.corpus = None
+        self.pool.nbs_submitted = 0
+
+        if self.conf.corpus and self.engine == 'process':
+            # workers run the streams we send them, rendered in advance
+            self.fun = run_stream
+            if self.mode == 'prepared':
+                self.fun = run_prepared_stream
 
     def run(self, system, phase):
         """Stream the given list of QUERIES on as many as CPU cores for given
@@ -72,8 +582,21 @@ class Stream(TpchComponent):
 
         """
         self.system = system
-        self.log("Running TPCH with %d CPUs for %ds, stream %s",
-                 self.cpu, self.duration, self.queries)
+        self.log("Running TPCH with %d %s for %ds, stream %s (%s)",
+                 self.cpu, self.unit(), self.duration, self.queries,
+                 self.mode)
+
+        if self.conf.arrival != 'closed':
+            self.log("Open-loop %s arrival of %g queries per minute",
+                     self.conf.arrival, self.conf.rate)
+
+        if self.conf.corpus:
+            seed = self.conf.seed or corpus.run_seed(self.track.name)
+            self.pool.corpus = corpus.Corpus.load(seed,
+                                                  self.conf.scale_factor,
+                                                  self.conf.corpus)
+            self.log("Using a corpus of %d variants per query, seed %d",
+                     self.pool.corpus.variants, seed)
 
         start = datetime.now()
 
@@ -81,12 +604,47 @@ class Stream(TpchComponent):
         self.pool.stream_id = self.track.register_job(phase, start)
         self.pool.nbs = 0       # nb stream
         self.pool.nbq = 0       # nb queries
+        self.pool.latencies = histogram.Histogram()     # whole job
+        self.pool.recorder = histogram.Recorder()
+        self.pool.raw = self.conf.raw
+        # the virtual users of the async engines must never wait for the
+        # writer, they all run in this thread
+        blocking = not isinstance(self.pool, AsyncStreamPool)
+        self.pool.writer = TrackingWriter(system, blocking=blocking)
 
-        secs = self.pool.run(stream, self.dsn, self.queries, self.system)
+        self.pool.writer.start()
+        try:
+            secs = self.pool.run(self.fun, self.dsn, self.queries,
+                                 self.system)
+        finally:
+            # wait until the tracking writes are done
+            self.pool.writer.stop()
+
+        self.log("%s", self.pool.writer.report())
         self.track.register_job_time(self.pool.stream_id, secs)
 
+        # flush what's left of the latency histograms
+        snapshot = self.pool.recorder.snapshot(force=True)
+        if snapshot:
+            self.track.register_histograms(self.pool.stream_id, snapshot)
+
+        self.secs = secs
+        self.qpm = self.pool.nbq / secs * 60.0
+
         self.log(
-            "executed %d streams (%d queries) in %gs at %gQPM, using %d CPU",
+            "executed %d streams (%d queries) in %gs at %gQPM, using %d %s",
             self.pool.nbs, self.pool.nbq,
-            secs, self.pool.nbq / secs * 60.0, self.cpu)
+            secs, self.pool.nbq / secs * 60.0, self.cpu, self.unit())
+
+        if self.conf.arrival != 'closed':
+            self.log("maximum backlog was %d queries", self.pool.max_backlog)
+
+            if self.pool.reused:
+                self.log("qgen was late, %d query streams were used again",
+                         self.pool.reused)
         return
+
+    def unit(self):
+        if self.engine == 'async':
+            return 'virtual users'
+        return 'CPU'
@@ -1,6 +1,6 @@
 import time
 import logging
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 
 class DistributedTasks():
@@ -8,28 +8,77 @@ class DistributedTasks():
     def __init__(self, cpu):
         self.cpu = cpu
 
-    def report_progress(self, arg):
+        # how often to call tick() while tasks are waiting to start, None is
+        # never
+        self.interval = None
+
+    def limit(self):
+        "Return how many tasks may run at the same time."
+        return self.cpu
+
+    def tick(self):
+        pass
+
+    def report_start(self, arg):
+        pass
+
+    def report_progress(self, arg, result):
+        pass
+
+    def report_failure(self, arg, error):
         pass
 
     def run(self, fun, arglist, *args):
         """Run FUN as many times as len(ARGLIST) and with an entry from ARGLIST
            each time, concurrently, on as many as CPU cores.
 
-        FUN is called as if by: [fun(x, *args) for x in arglist].
+        FUN is called as if by: [fun(x, *args) for x in arglist], and the
+        tasks are started in the order of ARGLIST, limit() at a time.
+
+        When some of the tasks fail, the other ones still run to completion,
+        and a RuntimeError is raised at the end.
         """
         self.start = time.monotonic()
 
         pool = ProcessPoolExecutor(self.cpu)
         results = []
+        failed = []
+
+        pending = list(arglist)
+        running = {}
+
+        while pending or running:
+            while pending and len(running) < self.limit():
+                arg = pending.pop(0)
+                self.report_start(arg)
+                running[pool.submit(fun, arg, *args)] = arg
+
+            done, _ = wait(running,
+                           timeout=self.interval,
+                           return_when=FIRST_COMPLETED)
 
-        fargs = {pool.submit(fun, arg, *args): arg for arg in arglist}
+            for future in done:
+                arg = running.pop(future)
 
-        for future in as_completed(fargs):
-            arg = fargs[future]
-            self.report_progress(arg)
-            results.append(future.result())
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.report_failure(arg, e)
+                    failed.append(arg)
+                    continue
+
+                self.report_progress(arg, result)
+                results.append(result)
+
+            # the limit only matters when there's something left to start
+            if pending:
+                self.tick()
 
         pool.shutdown(wait=False)
         self.end = time.monotonic()
 
+        if failed:
+            raise RuntimeError("%d tasks failed: %s"
+                               % (len(failed), sorted(failed)))
+
         return results, self.end - self.start
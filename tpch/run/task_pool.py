@@ -5,11 +5,15 @@ from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 class TaskPool():
 
-    def __init__(self, cpu, duration, pause=1):
+    def __init__(self, cpu, duration, pause=1, initializer=None, initargs=()):
         self.cpu = cpu
         self.duration = duration
         self.pause = pause
 
+        # called once in each worker process, see connection.init_worker
+        self.initializer = initializer
+        self.initargs = initargs
+
         self.tasks_done = []
         self.previous_report_time = 0
 
@@ -19,20 +23,30 @@ class TaskPool():
     def handle_results(self, results):
         pass
 
+    def task_args(self, args):
+        "Return the arguments of the next task, ARGS by default."
+        return args
+
     def run(self, fun, *args):
         """Run FUN with KWARGS as many times as possible for DURATION seconds,
         using as much as CPU cores in parallel. Return a list of results
         and the time we actually took in seconds.
 
         """
-        self.pool = ProcessPoolExecutor(self.cpu)
+        # the initializer arguments are new in Python 3.7
+        if self.initializer:
+            self.pool = ProcessPoolExecutor(self.cpu,
+                                            initializer=self.initializer,
+                                            initargs=self.initargs)
+        else:
+            self.pool = ProcessPoolExecutor(self.cpu)
         futures = []
 
         self.start = time.monotonic()
 
         # start CPU query streams in parallel
         for x in range(self.cpu):
-            futures.append(self.pool.submit(fun, *args))
+            futures.append(self.pool.submit(fun, *self.task_args(args)))
 
         while (time.monotonic() - self.start) < (self.duration):
             # we used to avoid busy looping too hard on the system when
@@ -63,7 +77,8 @@ class TaskPool():
             # otherwise and submit another stream of queries
             if (time.monotonic() - self.start) < (self.duration):
                 for x in range(len(ready)):
-                    futures.append(self.pool.submit(fun, *args))
+                    futures.append(self.pool.submit(fun,
+                                                    *self.task_args(args)))
 
             # now that the futures are queued to start, report our progress,
             # including track/register timings in a local database
@@ -1,8 +1,15 @@
+import os
+import time
 import os.path
+import logging
+import threading
+import itertools
 import psycopg2
+import psycopg2.extras
+from contextlib import contextmanager
 from datetime import datetime
 
-from . import initdb
+from . import initdb, utils, journal
 from datetime import date, datetime
 
 SCHEMA = os.path.join(os.path.dirname(__file__),
@@ -11,88 +18,609 @@ SCHEMA = os.path.join(os.path.dirname(__file__),
                       'schema',
                       'tracking.sql')
 
+# query timings are buffered in memory and written in bulk when we have
+# that many of them, or when the oldest of them is that many seconds old
+FLUSH_ROWS = 1000
+FLUSH_SECS = 5
+
+# tables that reference the job table, see tracking-delete-run.sql
+JOB_TABLES = ('query', 'backlog', 'saturation', 'tpch_test', 'refresh',
+              'histogram', 'load_step', 'load_copy')
+
+
+def seconds(duration):
+    "Return DURATION in seconds, from a timedelta or a psql timing."
+    if duration is None:
+        return None
+
+    return utils.duration_ms(duration) / 1000.0
+
+
+def timestamp(ts):
+    if ts is None:
+        return None
+
+    return ts.isoformat()
+
 
 class Tracking():
+    """Track the run in the results database, through a local journal: every
+    event is first appended to the journal, and then written to the
+    database. When the database fails, we keep going with the journal only,
+    and the journal is replayed later, see sync.
+
+    Jobs are known by a key of our own in the journal, and the key is
+    mapped to the job id in the results database when writing to it, the
+    same way tracking-merge-data.sql does.
 
+    """
     def __init__(self, conf, system, name):
         self.conf = conf
         self.system = system
         self.name = name
         self.dsn = self.conf.results.dsn
+        self.id = None
+
+        self.journal = journal.Journal(journal.filename(name))
+        self.online = True
+        self.replaying = False
+
+        # a single connection to the tracking database, opened on demand
+        self.conn = None
+        self.lock = threading.RLock()
+
+        self.jobs = {}
+        self.job_names = {}
+        self.keys = itertools.count(1)
+
+        self.buffer = []
+        self.buffered_since = None
+
+    def connect(self):
+        "Return our connection to the tracking database."
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(self.dsn)
+
+        return self.conn
+
+    def close(self):
+        "Write the buffered query timings and close our connection."
+        self.flush()
+
+        with self.lock:
+            if self.conn is not None and not self.conn.closed:
+                self.conn.close()
+            self.conn = None
+
+        self.journal.sync()
+        self.journal.close()
+
+    @contextmanager
+    def cursor(self):
+        """A cursor on our connection, in a transaction that's committed at
+        the end of the block, or rolled back on errors.
+
+        """
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                with conn.cursor() as curs:
+                    yield curs
+
+    def record(self, event):
+        """Append EVENT to the journal, then write it to the results database
+        unless it failed before.
+
+        """
+        with self.lock:
+            self.journal.append(event)
+
+            if event['event'] == 'query':
+                self.buffer_query(event)
+            else:
+                self.flush()
+                self.write(self.apply, event)
+
+    def write(self, fun, *args):
+        "Run FUN to write to the results database, unless we're offline."
+        if self.replaying:
+            # errors are fatal when replaying the journal
+            return fun(*args)
+
+        if not self.online:
+            return
+
+        try:
+            fun(*args)
+        except psycopg2.Error as e:
+            self.online = False
+            self.buffer = []
+
+            logger = logging.getLogger('TPCH')
+            logger.warning('%s: tracking database failed, going on with '
+                           'the journal %s only, see tpch.py sync: %s',
+                           self.system, self.journal.filename, e)
+
+    def apply(self, event):
+        "Write EVENT to the results database."
+        getattr(self, 'apply_%s' % event['event'])(event)
+
+    def job(self, key):
+        "Return the results database job id for the job KEY."
+        return self.jobs[key]
 
     def fetch_benchmark_id(self):
-        conn = psycopg2.connect(self.dsn)
-        curs = conn.cursor()
         sql = 'select id from run where name = %s'
-        curs.execute(sql, (self.name,))
-        self.id, = curs.fetchone()
-        conn.commit()
+
+        def fetch():
+            with self.cursor() as curs:
+                curs.execute(sql, (self.name,))
+                self.id, = curs.fetchone()
+
+        self.write(fetch)
         return self.id
 
     def register_benchmark(self, schedule):
-        conn = psycopg2.connect(self.dsn)
-        curs = conn.cursor()
+        self.record({'event': 'run',
+                     'name': self.name,
+                     'system': self.system,
+                     'setup': self.conf.to_json(),
+                     'schedule': schedule,
+                     'start': timestamp(datetime.now()),
+                     'sf': self.conf.scale.factor})
+        return self.id
+
+    def apply_run(self, event):
+        # running the same benchmark again resumes it, see load_progress
         sql = """
 insert into run(name, system, setup, schedule, start, sf)
-     values (%s, %s, %s, %s, now(), %s)
+     values (%s, %s, %s, %s, %s, %s)
+on conflict (name, system)
+  do update set schedule = excluded.schedule
   returning id;
 """
-        curs.execute(sql, (self.name,
-                           self.system,
-                           self.conf.to_json(),
-                           schedule,
-                           self.conf.scale.factor))
-        self.id, = curs.fetchone()
-
-        conn.commit()
-        return self.id
+        with self.cursor() as curs:
+            curs.execute(sql, (event['name'],
+                               event['system'],
+                               event['setup'],
+                               event['schedule'],
+                               event['start'],
+                               event['sf']))
+            self.id, = curs.fetchone()
 
     def register_run_time(self, duration):
-        conn = psycopg2.connect(self.dsn)
-        curs = conn.cursor()
+        self.record({'event': 'run_time', 'duration': duration})
+        self.journal.sync()
+        return
+
+    def apply_run_time(self, event):
         sql = """
 update run
    set duration = %s * interval '1 sec'
  where id = %s
 """
-        curs.execute(sql, (duration, self.id))
-        conn.commit()
-        return
+        with self.cursor() as curs:
+            curs.execute(sql, (event['duration'], self.id))
 
     def register_job(self, job_name, start, secs=None, steps=None):
-        conn = psycopg2.connect(self.dsn)
-        curs = conn.cursor()
+        # parallel sub-schedules share the journal, keep our keys apart
+        key = '%d.%d' % (os.getpid(), next(self.keys))
+        self.job_names[key] = job_name
+
+        self.record({'event': 'job',
+                     'job': key,
+                     'name': job_name,
+                     'start': timestamp(start),
+                     'duration': secs,
+                     'steps': steps})
+        return key
+
+    def apply_job(self, event):
         sql = """
 insert into job(run, name, steps, start, duration)
      values (%s, %s, %s, %s, %s * interval '1 sec')
   returning id;
 """
-        curs.execute(sql, (self.id, job_name, steps, start, secs))
-
-        job_id, = curs.fetchone()
-
-        conn.commit()
-        return job_id
+        with self.cursor() as curs:
+            curs.execute(sql, (self.id,
+                               event['name'],
+                               event['steps'],
+                               event['start'],
+                               event['duration']))
+            self.jobs[event['job']], = curs.fetchone()
 
     def register_job_time(self, job_id, duration):
-        conn = psycopg2.connect(self.dsn)
-        curs = conn.cursor()
+        # the job is done, write the query timings we still have
+        self.record({'event': 'job_time', 'job': job_id, 'duration': duration})
+        self.journal.sync()
+        return
+
+    def apply_job_time(self, event):
         sql = """
 update job
    set duration = %s * interval '1 sec'
  where id = %s
 """
-        curs.execute(sql, (duration, job_id))
-        conn.commit()
+        with self.cursor() as curs:
+            curs.execute(sql, (event['duration'], self.job(event['job'])))
+
+    def register_query_timings(self, job_id, query_name, duration,
+                               plan_time=None, exec_time=None):
+        "Journal the query timings, and buffer them, see flush."
+        self.record({'event': 'query',
+                     'job': job_id,
+                     'name': query_name,
+                     'duration': seconds(duration),
+                     'plan': seconds(plan_time),
+                     'exec': seconds(exec_time)})
         return
 
-    def register_query_timings(self, job_id, query_name, duration):
-        conn = psycopg2.connect(self.dsn)
-        curs = conn.cursor()
+    def buffer_query(self, event):
+        if not self.online:
+            return
+
+        if not self.buffer:
+            self.buffered_since = time.monotonic()
+
+        self.buffer.append(event)
+
+        if len(self.buffer) >= FLUSH_ROWS \
+           or time.monotonic() - self.buffered_since >= FLUSH_SECS:
+            self.flush()
+
+    def flush(self):
+        "Write the buffered query timings with multi-row inserts."
         sql = """
-insert into query(job, name, duration)
+insert into query(job, name, duration, plan_time, exec_time)
+     values %s;
+"""
+        template = """
+(%s, %s, %s * interval '1 sec', %s * interval '1 sec', %s * interval '1 sec')
+"""
+
+        def insert(rows):
+            with self.cursor() as curs:
+                psycopg2.extras.execute_values(curs, sql, rows,
+                                               template=template,
+                                               page_size=FLUSH_ROWS)
+
+        with self.lock:
+            if not self.buffer:
+                return
+
+            rows = [(self.job(e['job']), e['name'],
+                     e['duration'], e['plan'], e['exec'])
+                    for e in self.buffer]
+            self.buffer = []
+
+            self.write(insert, rows)
+        return
+
+    def register_histograms(self, job_id, snapshot):
+        """Register a SNAPSHOT of the latency histograms of a stream job, a
+        dict of query name to histogram.Histogram.
+
+        """
+        rows = []
+        for name, h in snapshot.items():
+            buckets, counts = h.buckets()
+            rows.append([name, h.count, h.total, h.min, h.max,
+                         buckets, counts])
+
+        self.record({'event': 'histogram',
+                     'job': job_id,
+                     'ts': timestamp(datetime.now()),
+                     'rows': rows})
+        return
+
+    def apply_histogram(self, event):
+        sql = """
+insert into histogram(job, name, ts, count, total, min, max, buckets, counts)
+     values %s;
+"""
+        template = """
+(%s, %s, %s, %s,
+ %s * interval '1 us', %s * interval '1 us', %s * interval '1 us',
+ %s, %s)
+"""
+        job_id = self.job(event['job'])
+        rows = [[job_id, row[0], event['ts']] + row[1:]
+                for row in event['rows']]
+
+        with self.cursor() as curs:
+            psycopg2.extras.execute_values(curs, sql, rows, template=template)
+
+    def register_backlog(self, job_id, depth):
+        self.record({'event': 'backlog',
+                     'job': job_id,
+                     'ts': timestamp(datetime.now()),
+                     'depth': depth})
+        return
+
+    def apply_backlog(self, event):
+        sql = """
+insert into backlog(job, ts, depth)
      values (%s, %s, %s);
 """
-        curs.execute(sql, (job_id, query_name, duration))
-        conn.commit()
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']),
+                               event['ts'],
+                               event['depth']))
+
+    def register_saturation_stage(self, job_id, name, stage, cpu, qpm, p95):
+        self.record({'event': 'saturation',
+                     'job': job_id,
+                     'name': name,
+                     'stage': stage,
+                     'cpu': cpu,
+                     'qpm': qpm,
+                     'p95': p95})
+        return
+
+    def apply_saturation(self, event):
+        sql = """
+insert into saturation(job, name, stage, cpu, qpm, p95)
+     values (%s, %s, %s, %s, %s, %s * interval '1 ms');
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']),
+                               event['name'],
+                               event['stage'],
+                               event['cpu'],
+                               event['qpm'],
+                               event['p95']))
+
+    def register_saturation_knee(self, job_id):
+        self.record({'event': 'knee', 'job': job_id})
+        return
+
+    def apply_knee(self, event):
+        sql = """
+update saturation
+   set knee = true
+ where job = %s
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']),))
+
+    def register_tpch_test(self, job_id, test, sf, streams):
+        self.record({'event': 'tpch_test',
+                     'job': job_id,
+                     'test': test,
+                     'sf': sf,
+                     'streams': streams})
+        return
+
+    def apply_tpch_test(self, event):
+        sql = """
+insert into tpch_test(job, test, sf, streams)
+     values (%s, %s, %s, %s);
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']),
+                               event['test'],
+                               event['sf'],
+                               event['streams']))
+
+    def register_load_start(self, job_id, unit):
+        relname, step = unit
+
+        # a unit that's started and not done needs a cleanup on resume
+        self.record({'event': 'load_start',
+                     'job': job_id,
+                     'name': self.job_names.get(job_id),
+                     'relname': relname,
+                     'step': step})
+        self.journal.sync()
+        return
+
+    def apply_load_start(self, event):
+        # the journal is enough for resuming, see load_progress
+        pass
+
+    def register_load_step(self, job_id, unit, attempts, start, secs,
+                           concurrency):
+        relname, step = unit
+
+        self.record({'event': 'load_step',
+                     'job': job_id,
+                     'name': self.job_names.get(job_id),
+                     'relname': relname,
+                     'step': step,
+                     'attempts': attempts,
+                     'start': timestamp(start),
+                     'duration': secs,
+                     'concurrency': concurrency})
+        self.journal.sync()
+        return
+
+    def apply_load_step(self, event):
+        sql = """
+insert into load_step(job, relname, step, attempts, start, duration,
+                      concurrency)
+     values (%s, %s, %s, %s, %s, %s * interval '1 sec', %s);
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']),
+                               event.get('relname'),
+                               event['step'],
+                               event['attempts'],
+                               event['start'],
+                               event['duration'],
+                               event.get('concurrency')))
+
+    def register_load_copy(self, job_id, step, relname, rows, size, secs):
+        self.record({'event': 'load_copy',
+                     'job': job_id,
+                     'relname': relname,
+                     'step': step,
+                     'rows': rows,
+                     'bytes': size,
+                     'duration': secs})
+        return
+
+    def apply_load_copy(self, event):
+        sql = """
+insert into load_copy(job, relname, step, rows, bytes, duration)
+     values (%s, %s, %s, %s, %s, %s * interval '1 sec');
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']),
+                               event['relname'],
+                               event['step'],
+                               event['rows'],
+                               event['bytes'],
+                               event['duration']))
+
+    def register_checkpoint(self, job_name, checkpoint):
+        self.record({'event': 'checkpoint',
+                     'name': job_name,
+                     'checkpoint': checkpoint})
+        self.journal.sync()
+        return
+
+    def apply_checkpoint(self, event):
+        # the journal is enough for resuming, see checkpoints
+        pass
+
+    def checkpoints(self, job_name):
+        "Return the set of checkpoints the job JOB_NAME got past in this run."
+        checkpoints = set()
+
+        if not os.path.exists(self.journal.filename):
+            return checkpoints
+
+        for event in self.journal.events():
+            if event['event'] == 'checkpoint' and event['name'] == job_name:
+                checkpoints.add(event['checkpoint'])
+
+        return checkpoints
+
+    def load_progress(self, job_name):
+        """Return whether the load job JOB_NAME has been started before in
+        this run, the set of its (relname, step) units that are done already,
+        and the set of its units that have been started, where a None relname
+        is a whole step.
+
+        """
+        resume = False
+        done = set()
+        started = set()
+
+        if not os.path.exists(self.journal.filename):
+            return resume, done, started
+
+        # the journal is the reference, it has all the previous attempts
+        for event in self.journal.events():
+            if event['event'] == 'job' and event['name'] == job_name:
+                resume = True
+
+            elif event['event'] == 'load_start' \
+                    and event['name'] == job_name:
+                started.add((event['relname'], event['step']))
+
+            elif event['event'] == 'load_step' and event['name'] == job_name:
+                done.add((event.get('relname'), event['step']))
+
+        return resume, done, started
+
+    def reserve_update_sets(self, job_id, count):
+        """Reserve the next COUNT update sets of this run for JOB_ID and
+        return them: each update set can only be applied once to the
+        database, even by jobs running in parallel.
+
+        """
+        # the journal is the reference, even when the database is offline,
+        # and all the processes of the run share it
+        with self.journal.locked():
+            last = 0
+            for event in self.journal.events():
+                if event['event'] == 'updsets':
+                    last = max([last] + event['updsets'])
+
+            updsets = list(range(last + 1, last + count + 1))
+            self.record({'event': 'updsets',
+                         'job': job_id,
+                         'updsets': updsets})
+
+        return updsets
+
+    def apply_updsets(self, event):
+        sql = """
+insert into refresh(job, updset)
+     select %s, unnest(%s::integer[]);
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (self.job(event['job']), event['updsets']))
+
+    def register_refresh(self, job_id, updset, start, rf1, rf2):
+        self.record({'event': 'refresh',
+                     'job': job_id,
+                     'updset': updset,
+                     'start': timestamp(start),
+                     'rf1': seconds(rf1),
+                     'rf2': seconds(rf2)})
         return
+
+    def apply_refresh(self, event):
+        sql = """
+update refresh
+   set start = %s,
+       rf1 = %s * interval '1 sec',
+       rf2 = %s * interval '1 sec'
+ where job = %s and updset = %s
+"""
+        with self.cursor() as curs:
+            curs.execute(sql, (event['start'],
+                               event['rf1'],
+                               event['rf2'],
+                               self.job(event['job']),
+                               event['updset']))
+
+    def sync(self):
+        """Replay the journal of the run into the results database, replacing
+        what the database already has for the run. Return how many events
+        have been replayed.
+
+        """
+        count = 0
+        deleted = False
+        self.replaying = True
+
+        with self.lock:
+            for event in self.journal.events():
+                # a run that's been resumed has several run events
+                if event['event'] == 'run' and not deleted:
+                    self.delete_run(event['name'], event['system'])
+                    deleted = True
+
+                if event['event'] == 'query':
+                    self.buffer_query(event)
+                else:
+                    self.flush()
+                    self.apply(event)
+                count += 1
+
+            self.flush()
+
+        self.replaying = False
+        return count
+
+    def delete_run(self, name, system):
+        "Delete the run NAME on SYSTEM from the results database."
+        jobs = """
+select job.id
+  from job join run on run.id = job.run
+ where run.name = %s and run.system = %s
+"""
+        with self.cursor() as curs:
+            for table in JOB_TABLES:
+                curs.execute('delete from %s where job in (%s)'
+                             % (table, jobs), (name, system))
+
+            for table in ('sync', 'job'):
+                curs.execute('delete from %s where run in (select id from run '
+                             'where name = %%s and system = %%s)' % table,
+                             (name, system))
+            curs.execute('delete from run where name = %s and system = %s',
+                         (name, system))
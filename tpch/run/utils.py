@@ -38,7 +38,7 @@ def run_schema_file(dsn, filename, system, logger, debug=False):
     return now, secs
 
 
-def run_command(command, verbose=False):
+def run_command(command, verbose=False, cwd=None, env=None):
     "Run a command in a subprocess"
     cmd = shlex.split(command)
 
@@ -46,6 +46,8 @@ def run_command(command, verbose=False):
         logging.getLogger('TPCH').info(cmd)
 
     with subprocess.Popen(cmd,
+                          cwd=cwd,
+                          env=env,
                           encoding='utf-8',
                           stdout=subprocess.PIPE,
                           stderr=subprocess.PIPE) as p:
@@ -76,6 +78,17 @@ def parse_psql_timings(queries, output):
     return timings
 
 
+def duration_ms(duration):
+    """Return DURATION in milliseconds, from either a timedelta or a psql
+    timing such as '12.345 ms'.
+
+    """
+    if isinstance(duration, datetime.timedelta):
+        return duration.total_seconds() * 1000.0
+
+    return float(duration.split()[0])
+
+
 def expand_step_range(steps):
     """Explode the notation 2..10 into the Python list
 
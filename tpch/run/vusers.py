@@ -0,0 +1,115 @@
+import time
+import shlex
+import asyncio
+import logging
+import psycopg2
+import psycopg2.extensions
+from datetime import timedelta
+from asyncio.subprocess import PIPE
+
+from . import qgen
+
+# Asyncio primitives for the async stream engine, see AsyncStreamPool in
+# stream.py. We use psycopg2 asynchronous connections and integrate their
+# file descriptors in the asyncio event loop.
+
+
+async def wait(conn):
+    "Wait until the asynchronous psycopg2 connection CONN is ready."
+    loop = asyncio.get_running_loop()
+
+    while True:
+        state = conn.poll()
+
+        if state == psycopg2.extensions.POLL_OK:
+            return
+
+        elif state == psycopg2.extensions.POLL_READ:
+            await wait_fd(loop.add_reader, loop.remove_reader, conn.fileno())
+
+        elif state == psycopg2.extensions.POLL_WRITE:
+            await wait_fd(loop.add_writer, loop.remove_writer, conn.fileno())
+
+        else:
+            raise psycopg2.OperationalError("bad poll state: %s" % state)
+
+
+async def wait_fd(add, remove, fd):
+    "Wait until FD is ready, using the ADD and REMOVE event loop methods."
+    future = asyncio.get_running_loop().create_future()
+
+    def ready():
+        if not future.done():
+            future.set_result(None)
+
+    add(fd, ready)
+    try:
+        await future
+    finally:
+        remove(fd)
+
+
+async def connect(dsn):
+    conn = psycopg2.connect(dsn, async_=True)
+    await wait(conn)
+    return conn
+
+
+async def render(queries):
+    "Run qgen without blocking the event loop, see qgen.render."
+    cmd, env = qgen.command(queries)
+    proc = await asyncio.create_subprocess_exec(*shlex.split(cmd),
+                                                cwd=qgen.TPCH_SRC,
+                                                env=env,
+                                                stdout=PIPE,
+                                                stderr=PIPE)
+    out, err = await proc.communicate()
+
+    if err:
+        raise RuntimeError("qgen failed: %s" % err.decode('utf-8'))
+
+    lines = out.decode('utf-8').splitlines()
+    return list(zip(queries.split(), qgen.split(lines)))
+
+
+async def execute(conn, sql, name, system):
+    """Execute query SQL on CONN and fetch its result set, return how much
+    time it took as a timedelta, or None when the query failed.
+
+    """
+    curs = conn.cursor()
+    start = time.perf_counter_ns()
+
+    try:
+        curs.execute(sql)
+        await wait(conn)
+        if curs.description:
+            curs.fetchall()
+    except psycopg2.Error as e:
+        logger = logging.getLogger('TPCH')
+        logger.error('%s: query %s failed: %s', system, name, e)
+        return None
+    finally:
+        end = time.perf_counter_ns()
+        curs.close()
+
+    return timedelta(microseconds=(end - start) / 1000)
+
+
+async def driver_stream(conn, stream, system):
+    """Async version of stream.driver_stream, using the virtual user CONN to
+    run the already rendered STREAM, a list of (name, sql) tuples.
+
+    """
+    timings = {}
+
+    for name, sql in stream:
+        duration = await execute(conn, sql, name, system)
+
+        if duration is not None:
+            timings[name] = duration
+
+        if conn.closed:
+            break
+
+    return timings
@@ -0,0 +1,122 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+# The stream jobs hand their tracking writes over to a background thread,
+# so that a slow results database doesn't delay starting the next query
+# stream. The queue is bounded: when it's full the job waits for the
+# writer, and we keep track of how often and how long that happened.
+#
+# The async engines run their virtual users in the same thread as the
+# submissions, and waiting there would stall all of them. Their writes go
+# to an overflow list instead when the queue is full, and we count those.
+QUEUE_SIZE = 10000
+
+# how long the writer waits for the queue before looking at the overflow
+POLL_SECS = 1
+
+
+class TrackingWriter():
+    def __init__(self, system, size=QUEUE_SIZE, blocking=True):
+        self.system = system
+        self.blocking = blocking
+        self.queue = queue.Queue(maxsize=size)
+        self.overflow = deque()
+        self.thread = threading.Thread(target=self.loop,
+                                       name='tracking writer',
+                                       daemon=True)
+        self.logger = logging.getLogger('TPCH')
+
+        # backpressure metrics
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.stalls = 0
+        self.stalled = 0.0
+        self.overflows = 0
+        self.max_overflow = 0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        "Wait until all the submitted writes are done."
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, fun, *args):
+        """Have the background thread run the tracking function FUN with
+        ARGS. When the queue is full, wait for a free slot, or when we can't
+        block, add the write to the overflow list.
+
+        """
+        self.submitted += 1
+
+        try:
+            self.queue.put_nowait((fun, args))
+        except queue.Full:
+            if not self.blocking:
+                self.overflow.append((fun, args))
+                self.overflows += 1
+                self.max_overflow = max(self.max_overflow,
+                                        len(self.overflow))
+                return
+
+            start = time.monotonic()
+            self.queue.put((fun, args))
+            self.stalls += 1
+            self.stalled += time.monotonic() - start
+
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def depth(self):
+        return self.queue.qsize() + len(self.overflow)
+
+    def next(self):
+        "Return the next write to run, the overflow goes first."
+        while True:
+            if self.overflow:
+                return self.overflow.popleft()
+
+            try:
+                return self.queue.get(timeout=POLL_SECS)
+            except queue.Empty:
+                pass
+
+    def loop(self):
+        while True:
+            item = self.next()
+
+            if item is None:
+                # the overflow might have some more writes for us
+                while self.overflow:
+                    self.write(*self.overflow.popleft())
+                return
+
+            self.write(*item)
+
+    def write(self, fun, args):
+        try:
+            fun(*args)
+            self.written += 1
+        except Exception as e:
+            # a failed write must not stop the writer
+            self.failed += 1
+            self.logger.error('%s: tracking write failed: %s',
+                              self.system, e)
+
+    def report(self):
+        "Return a summary of the backpressure metrics, for the logs."
+        if not self.blocking:
+            return "%d tracking writes (%d failed), max queue depth %d, " \
+                "overflowed %d times, max overflow %d" % (
+                    self.written, self.failed, self.max_depth,
+                    self.overflows, self.max_overflow)
+
+        return "%d tracking writes (%d failed), max queue depth %d, " \
+            "stalled %d times for %gs" % (self.written, self.failed,
+                                          self.max_depth,
+                                          self.stalls, self.stalled)
@@ -1,10 +1,13 @@
 import os
 import os.path
+import re
 import logging
 
 import boto3
+import psycopg2
 
 from collections import namedtuple
+from contextlib import ExitStack
 
 from .infra import setup
 from .infra import rds
@@ -13,11 +16,23 @@ from .infra import instance
 from .infra import pgsql
 from .infra import utils
 from .control import utils as cntl
+from .control import merge
 
 MAKEFILE      = 'Makefile.loader'
 MAKE_OS_TOOLS = 'make -C tpch -f %s %%s tools' % MAKEFILE
-MAKE_RES_DUMP = 'make -C tpch -f %s dump' % MAKEFILE
-DUMP_FILES    = ['run.copy', 'job.copy', 'query.copy']
+MAKE_RES_DUMP = 'make -s --no-print-directory -C tpch -f %s %%s dump' \
+    % MAKEFILE
+DUMP_FILES    = ['run.copy', 'job.copy', 'query.copy',
+                 'backlog.copy', 'saturation.copy',
+                 'tpch_test.copy', 'refresh.copy', 'histogram.copy',
+                 'load_step.copy', 'load_copy.copy']
+
+# those tables are dumped incrementally, past the watermark of the previous
+# merge of results, and their local copy files are appended to: the local
+# copy files are only kept for export and import of the results
+WATERMARKS    = {'query': 'QUERY_ID',
+                 'backlog': 'BACKLOG_ID',
+                 'histogram': 'HISTOGRAM_ID'}
 
 MERGE_RESULTS  = os.path.relpath(
     os.path.join(cntl.TOPDIR, 'scripts', 'merge-results.sh'))
@@ -195,6 +210,22 @@ class System():
             # the loader isn't running yet, we're not ready
             return False
 
+    def resources(self):
+        """Return the list of our resources to wait for, as (name, function)
+        where the function blocks until the resource is ready.
+
+        """
+        resources = [('%s loader' % self.name, self.loader.wait_for_public_ip)]
+
+        if self.dbtype in ('RDS', 'Aurora'):
+            resources.append(('%s database' % self.name, self.db.wait_for_dsn))
+
+        elif self.dbtype == 'PgSQL':
+            resources.append(('%s database' % self.name,
+                              self.db.wait_for_public_ip))
+
+        return resources
+
     def tpch_is_running(self):
         if self.is_ready():
             ip = self.loader.public_ip()
@@ -212,23 +243,25 @@ class System():
                 return False
         return False
 
-    def tail(self, follow=False, n=10):
+    def tail(self, follow=False, n=10, pattern=None):
         if self.is_ready():
             ip = self.loader.wait_for_public_ip()
 
             if follow:
-                command = "tail -f tpch.log"
-                remote = cntl.BufferedRemoteCommand(ip, command)
+                command = "tail -n %s -f tpch.log" % n
+                remote = cntl.BufferedRemoteCommand(ip, command,
+                                                    name=self.name)
                 remote.open()
 
-                # return an iterator object
-                return iter(remote)
+                # to use with cntl.multitail()
+                return remote
 
             else:
                 command = "tail -n %s tpch.log" % n
                 out, _ = cntl.execute_remote_command(ip, command)
                 for line in out:
-                    print(line)
+                    if pattern is None or re.search(pattern, line):
+                        print(line)
 
         return
 
@@ -291,15 +324,19 @@ class System():
         if self.loader.status() == 'running':
             ip = self.loader.public_ip()
 
-            self.fetch_logs_and_results(ip)
-            self.merge_results(resdb)
+            # streams the new results into resdb
+            self.fetch_logs_and_results(ip, resdb)
 
         else:
             self.merge_results(resdb)
 
         return
 
-    def fetch_logs_and_results(self, ip=None):
+    def fetch_logs_and_results(self, ip=None, resdb=None):
+        """Download the logs of the loader and merge its results into RESDB,
+        only the results that are new since the previous merge.
+
+        """
         if not ip:
             if self.is_ready():
                 ip = self.loader.public_ip()
@@ -317,27 +354,78 @@ class System():
 
         session.download('tpch.log', logfile)
 
-        # fetch current results
-        self.log.info('%s: dumping current results', self.name)
-        self.log.info("%s: ssh -l ec2-user %s %s" % (self.name,
-                                                     ip,
-                                                     MAKE_RES_DUMP))
-        session.execute(MAKE_RES_DUMP)
-
-        copy_files = self.list_copy_files()
-        resdir = os.path.relpath(cntl.resdir(self.run))
-
-        for src, dest in copy_files.items():
-            self.log.info('%s: downloading results in %s',
-                          self.name, os.path.relpath(dest))
-            session.download(src, dest)
+        if resdb:
+            self.stream_results(session, resdb)
 
         session.close()
         return
 
+    def stream_results(self, session, resdb):
+        """Stream the results dump of the loader over SESSION straight into
+        RESDB, past the watermarks of the previous merge.
+
+        """
+        watermarks = self.watermarks(resdb)
+
+        dump = MAKE_RES_DUMP % ' '.join('%s=%d' % (var, watermarks.get(tab, 0))
+                                        for tab, var in WATERMARKS.items())
+
+        self.log.info('%s: streaming current results', self.name)
+        self.log.info("%s: ssh -l ec2-user %s %s",
+                      self.name, session.ip, dump)
+        channel, stream = session.stream(dump)
+
+        def check():
+            rc = channel.recv_exit_status()
+            if rc != 0:
+                err = channel.makefile_stderr('rb').read().decode('utf-8')
+                for line in err.splitlines():
+                    self.log.error('%s: %s', self.name, line)
+                raise RuntimeError("%s: results dump returned %d"
+                                   % (self.name, rc))
+
+        with ExitStack() as stack:
+            # keep a local copy of the results, appending the new rows past
+            # the watermarks to what we already have
+            archive = {}
+            for src, dest in self.list_copy_files().items():
+                tab, _ = os.path.splitext(src)
+                mode = 'ab' if watermarks.get(tab) else 'wb'
+                archive[tab] = stack.enter_context(open(dest, mode))
+
+            rows = merge.merge(resdb, stream, archive, check)
+
+        self.log.info('%s: merged %s', self.name,
+                      ', '.join('%d %s' % (rows[tab], tab)
+                                for tab in merge.TABLES if tab in rows))
+        return
+
+    def watermarks(self, resdb):
+        """Return the watermarks of the previous merge of our results in
+        RESDB, as a dict of table name to the last id merged.
+
+        """
+        conn = psycopg2.connect(resdb)
+        curs = conn.cursor()
+        sql = """
+select relname, watermark
+  from sync
+       join run on run.id = sync.run
+ where run.name = %s and run.system = %s
+"""
+        curs.execute(sql, (self.run, self.name))
+        watermarks = dict(curs.fetchall())
+        conn.close()
+
+        return watermarks
+
     def merge_results(self, resdb):
-        # merge results in local tracking database
+        # merge the local copy of the results in the tracking database
         resdir = os.path.relpath(cntl.resdir(self.run))
+
+        if not all(os.path.exists(f) for f in self.list_copy_files().values()):
+            self.log.info("%s: no local copy of the results", self.name)
+            return
         command = MERGE_RESULTS % (resdb, self.name, resdir, self.run)
 
         self.log.info("%s: merging results", self.name)